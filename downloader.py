@@ -1,11 +1,17 @@
 import os
 import json
-import time
+import asyncio
 import logging
-from telethon.sync import TelegramClient
+import aiofiles
+from telethon import TelegramClient
 from telethon.tl.types import PeerChannel, InputMessagesFilterPhotos
 from tqdm import tqdm
 
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library if orjson is not installed
+    orjson = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -16,6 +22,30 @@ logger = logging.getLogger(__name__)
 
 CONFIG_FILE = 'config.json'
 DOWNLOADED_PHOTOS_FILE = 'downloaded_photos.json'
+TOPIC_PROGRESS_FILE = 'topic_progress.json'
+DEFAULT_MAX_CONCURRENT_DOWNLOADS = 8
+# Downloaded IDs are appended to the state file in batches of this size...
+STATE_BATCH_SIZE = 32
+# ...or after this many seconds, whichever comes first
+STATE_FLUSH_INTERVAL = 5.0
+
+
+def json_loads(data):
+    """
+    Parse JSON from bytes, using orjson when it is available.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj):
+    """
+    Serialize an object to compact JSON bytes, using orjson when it is available.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
 
 
 def load_config(file_path):
@@ -26,8 +56,8 @@ def load_config(file_path):
     :return: Parsed configuration as a dictionary.
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(file_path, 'rb') as f:
+            return json_loads(f.read())
     except FileNotFoundError:
         logger.error(f"Configuration file '{file_path}' not found.")
         exit(1)
@@ -36,48 +66,196 @@ def load_config(file_path):
         exit(1)
 
 
+def _photo_ids(entry):
+    """
+    Convert a stored state entry into a set of message IDs.
+
+    Accepts the compacted list of IDs as well as the old dictionary format keyed
+    by photo paths ("downloads/<chat>/<topic>/<message_id>.jpg").
+    """
+    if isinstance(entry, dict):
+        ids = set()
+        for path in entry:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            if stem.isdigit():
+                ids.add(int(stem))
+        return ids
+    if isinstance(entry, list):
+        return set(entry)
+    return {entry}
+
+
 def load_downloaded_photos(file_path):
     """
-    Load already downloaded photos info from a JSON file.
+    Load the IDs of already downloaded photos from the state file.
+
+    The file holds a compacted JSON list of message IDs optionally followed by
+    JSON lines appended during the last run, one message ID per line.
+
+    :param file_path: Path to the state file with downloaded photos data.
+    :return: Set of downloaded message IDs.
+    """
+    if not os.path.exists(file_path):
+        return set()
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    try:
+        # Compacted state (or the old indented JSON format) is a single document
+        return _photo_ids(json_loads(content))
+    except json.JSONDecodeError:
+        pass
+
+    lines = content.splitlines()
+    if lines and not content.endswith(b"\n"):
+        # A crash can leave a half-written last line; a partial ID must not be trusted
+        logger.warning(f"Ignoring unterminated last line in '{file_path}'.")
+        lines.pop()
+
+    downloaded_ids = set()
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            downloaded_ids |= _photo_ids(json_loads(line))
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping unparsable line in '{file_path}'.")
+    return downloaded_ids
+
+
+def save_downloaded_photos(file_path, downloaded_ids):
+    """
+    Compact the downloaded photos info into a single JSON list of message IDs.
+
+    :param file_path: Path to the state file.
+    :param downloaded_ids: Set of downloaded message IDs.
+    """
+    tmp_path = f"{file_path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(json_dumps(sorted(downloaded_ids)) + b"\n")
+        os.replace(tmp_path, file_path)
+    except Exception as e:
+        logger.error(f"Error saving downloaded photos info: {e}")
+
+
+def topic_progress_key(chat_id, topic_id):
+    """
+    Build the key under which a topic's last completed message ID is stored.
+    """
+    return f"{chat_id}/{topic_id}"
 
-    :param file_path: Path to the JSON file with downloaded photos data.
-    :return: Dictionary with downloaded photo paths.
+
+def load_topic_progress(file_path):
+    """
+    Load the last completed message ID of every chat/topic.
+
+    :param file_path: Path to the JSON file with topic progress.
+    :return: Dictionary mapping "chat_id/topic_id" to a message ID.
     """
     if os.path.exists(file_path):
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(file_path, 'rb') as f:
+                return json_loads(f.read())
         except json.JSONDecodeError:
             logger.warning(f"Could not parse '{file_path}'. Starting with an empty dictionary.")
     return {}
 
 
-def save_downloaded_photos(file_path, data):
+def save_topic_progress(file_path, topic_progress):
     """
-    Save the downloaded photos info to a JSON file.
+    Save the last completed message ID of every chat/topic.
 
-    :param file_path: Path to the JSON file.
-    :param data: Dictionary containing downloaded photo paths.
+    :param file_path: Path to the JSON file with topic progress.
+    :param topic_progress: Dictionary mapping "chat_id/topic_id" to a message ID.
     """
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
+        with open(file_path, 'wb') as f:
+            f.write(json_dumps(topic_progress))
     except Exception as e:
-        logger.error(f"Error saving downloaded photos info: {e}")
+        logger.error(f"Error saving topic progress: {e}")
+
+
+class DownloadedPhotosWriter:
+    """
+    Buffer downloaded message IDs and append them to the state file in batches.
+
+    Pending IDs are written once `batch_size` of them have accumulated or
+    `flush_interval` seconds after the first one arrived, whichever comes first.
+    The file is fsynced only when the writer is closed at the end of a topic.
+    """
+
+    def __init__(self, state_file, batch_size=STATE_BATCH_SIZE, flush_interval=STATE_FLUSH_INTERVAL):
+        """
+        :param state_file: State file opened with aiofiles in binary append mode.
+        :param batch_size: Number of pending IDs that triggers a write.
+        :param flush_interval: Seconds after which pending IDs are written anyway.
+        """
+        self.state_file = state_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.timer = None
+        self.timer_flushes = set()
+
+    async def add(self, message_id):
+        """
+        Queue a downloaded message ID, writing the batch if it is full.
+
+        :param message_id: ID of the message whose photo was downloaded.
+        """
+        self.pending.append(message_id)
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.flush_interval, self._flush_on_timer)
+
+    def _flush_on_timer(self):
+        self.timer = None
+        task = asyncio.ensure_future(self.flush())
+        self.timer_flushes.add(task)
+        task.add_done_callback(self.timer_flushes.discard)
+
+    async def flush(self):
+        """
+        Append all pending IDs to the state file.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            await self.state_file.write(b"".join(json_dumps(message_id) + b"\n" for message_id in batch))
+            await self.state_file.flush()
+        except Exception as e:
+            logger.error(f"Error saving downloaded photos info: {e}")
+
+    async def close(self):
+        """
+        Write the remaining IDs and fsync the state file.
+        """
+        await self.flush()
+        if self.timer_flushes:
+            await asyncio.gather(*self.timer_flushes)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, os.fsync, self.state_file.fileno())
+        except Exception as e:
+            logger.error(f"Error syncing downloaded photos info: {e}")
 
 
-def get_chat_and_topic_titles(chat_id, topic_id, client):
+async def get_chat_and_topic_titles(chat_id, topic_id, client):
     """
     Retrieve the chat title and a formatted topic title.
 
     :param chat_id: Telegram chat/channel ID.
     :param topic_id: Topic identifier (reply-to message ID).
-    :param client: Initialized TelegramClient instance.
+    :param client: Connected TelegramClient instance.
     :return: Tuple (chat_title, topic_title)
     """
     logger.info(f"Fetching titles for chat ID {chat_id} and topic ID {topic_id}...")
     try:
-        chat = client.get_entity(PeerChannel(chat_id))
+        chat = await client.get_entity(PeerChannel(chat_id))
         # Replace spaces with underscores for folder naming
         chat_title = chat.title.replace(" ", "_")
         topic_title = f"topic_{topic_id}"
@@ -87,33 +265,102 @@ def get_chat_and_topic_titles(chat_id, topic_id, client):
         return "unknown_chat", f"topic_{topic_id}"
 
 
-def download_photos(client, phone_number, chat_id, topics, downloaded_photos):
+async def download_photo(client, message, file_path):
+    """
+    Download a single photo, retrying once after a pause on failure.
+
+    :param client: Connected TelegramClient instance.
+    :param message: Telegram message containing the photo.
+    :param file_path: Destination path for the photo.
+    :return: True if the photo was saved, False otherwise.
+    """
+    try:
+        await client.download_media(message.media, file=file_path)
+        if os.path.exists(file_path):
+            return True
+        logger.error(f"File {file_path} not found after download.")
+        return False
+    except Exception as e:
+        logger.error(f"Error downloading photo {message.id}: {e}")
+        logger.info("Retrying in 60 seconds...")
+
+    # Only this worker waits; the others keep downloading
+    await asyncio.sleep(60)
+    try:
+        await client.download_media(message.media, file=file_path)
+        if os.path.exists(file_path):
+            return True
+        logger.error(f"File {file_path} not found after retry.")
+    except Exception as retry_error:
+        logger.error(f"Retry failed for photo {message.id}: {retry_error}")
+    return False
+
+
+async def download_worker(client, queue, downloaded_ids, state_writer, failed_ids, progress):
+    """
+    Take (message, file_path) pairs from the queue and download them until a None sentinel arrives.
+
+    :param client: Connected TelegramClient instance.
+    :param queue: asyncio.Queue with pending downloads.
+    :param downloaded_ids: Set of already downloaded message IDs.
+    :param state_writer: DownloadedPhotosWriter recording downloaded photos.
+    :param failed_ids: List collecting IDs of messages whose photo could not be downloaded.
+    :param progress: tqdm progress bar shared by all workers.
+    :return: Number of photos downloaded by this worker.
+    """
+    downloaded = 0
+    while True:
+        item = await queue.get()
+        try:
+            if item is None:
+                return downloaded
+            message, file_path = item
+            if await download_photo(client, message, file_path):
+                downloaded_ids.add(message.id)
+                downloaded += 1
+                await state_writer.add(message.id)
+            else:
+                failed_ids.append(message.id)
+            progress.update(1)
+        finally:
+            queue.task_done()
+
+
+async def download_photos(client, phone_number, chat_id, topics, downloaded_ids, topic_progress,
+                          max_concurrent_downloads=DEFAULT_MAX_CONCURRENT_DOWNLOADS):
     """
     Download photos from specified Telegram topics.
 
+    Messages are streamed from Telegram into a bounded queue that is drained by
+    `max_concurrent_downloads` workers, so several photos are downloaded at once.
+    Messages at or below the topic's last completed message ID are filtered out
+    by the server with `min_id`.
+
     :param client: TelegramClient instance.
     :param phone_number: Phone number for authorization.
     :param chat_id: Chat/channel ID.
     :param topics: List of topic IDs.
-    :param downloaded_photos: Dictionary with already downloaded photos.
+    :param downloaded_ids: Set of already downloaded message IDs.
+    :param topic_progress: Dictionary with the last completed message ID per chat/topic.
+    :param max_concurrent_downloads: Number of simultaneous downloads.
     """
     try:
-        client.connect()
+        await client.connect()
 
         # Authorize user if not already authorized
-        if not client.is_user_authorized():
+        if not await client.is_user_authorized():
             logger.info("Authorizing user...")
-            client.send_code_request(phone_number)
+            await client.send_code_request(phone_number)
             code = input("Enter the code: ")
-            client.sign_in(phone_number, code)
+            await client.sign_in(phone_number, code)
 
         # Get chat entity and format chat title
-        chat = client.get_entity(PeerChannel(chat_id))
+        chat = await client.get_entity(PeerChannel(chat_id))
         chat_title = chat.title.replace(" ", "_")
 
         for topic_id in topics:
             # Get titles for chat and topic
-            _, topic_title = get_chat_and_topic_titles(chat_id, topic_id, client)
+            _, topic_title = await get_chat_and_topic_titles(chat_id, topic_id, client)
             logger.info(f"Chat title: {chat_title}, Topic title: {topic_title}")
 
             # Prepare the directory to save photos
@@ -121,59 +368,85 @@ def download_photos(client, phone_number, chat_id, topics, downloaded_photos):
             os.makedirs(save_path, exist_ok=True)
 
             logger.info(f"Fetching photos from topic ID {topic_id}...")
-            messages = client.iter_messages(
+            # limit=0 only asks the server for the number of matching messages
+            total_photos = (await client.get_messages(
                 chat_id,
                 filter=InputMessagesFilterPhotos(),
-                limit=None,
+                limit=0,
                 reply_to=topic_id
-            )
-            messages_list = list(messages)
-            total_photos = len(messages_list)
+            )).total
 
             if total_photos == 0:
                 logger.info(f"No photos found in topic ID {topic_id}.")
                 continue
 
             logger.info(f"Found {total_photos} photos in topic '{topic_title}'. Starting download...")
-            found_photos = 0
-
-            for message in tqdm(messages_list, total=total_photos, desc=f"Downloading from {topic_title}",
-                                unit="photo"):
-                if message.photo:
-                    file_path = os.path.join(save_path, f"{message.id}.jpg")
-                    if file_path not in downloaded_photos:
-                        try:
-                            # Download photo media
-                            client.download_media(message.media, file=file_path)
-                            if os.path.exists(file_path):
-                                downloaded_photos[file_path] = True
-                                found_photos += 1
-                                save_downloaded_photos(DOWNLOADED_PHOTOS_FILE, downloaded_photos)
-                            else:
-                                logger.error(f"File {file_path} not found after download.")
-                        except Exception as e:
-                            logger.error(f"Error downloading photo {message.id}: {e}")
-                            logger.info("Retrying in 60 seconds...")
-                            time.sleep(60)
-                            try:
-                                client.download_media(message.media, file=file_path)
-                                if os.path.exists(file_path):
-                                    downloaded_photos[file_path] = True
-                                    found_photos += 1
-                                    save_downloaded_photos(DOWNLOADED_PHOTOS_FILE, downloaded_photos)
-                                else:
-                                    logger.error(f"File {file_path} not found after retry.")
-                            except Exception as retry_error:
-                                logger.error(f"Retry failed for photo {message.id}: {retry_error}")
+            progress_key = topic_progress_key(chat_id, topic_id)
+            last_id = topic_progress.get(progress_key, 0)
+            if last_id:
+                logger.info(f"Skipping photos up to message ID {last_id} completed in earlier runs.")
+            queue = asyncio.Queue(maxsize=max_concurrent_downloads * 2)
+            failed_ids = []
+            newest_id = 0
+
+            async with aiofiles.open(DOWNLOADED_PHOTOS_FILE, 'ab') as state_file:
+                state_writer = DownloadedPhotosWriter(state_file)
+                # The total only matches the streamed messages when nothing is skipped via min_id
+                with tqdm(total=None if last_id else total_photos,
+                          desc=f"Downloading from {topic_title}", unit="photo") as progress:
+                    workers = [
+                        asyncio.create_task(
+                            download_worker(client, queue, downloaded_ids, state_writer, failed_ids, progress)
+                        )
+                        for _ in range(max_concurrent_downloads)
+                    ]
+                    try:
+                        async for message in client.iter_messages(
+                            chat_id,
+                            filter=InputMessagesFilterPhotos(),
+                            limit=None,
+                            reply_to=topic_id,
+                            min_id=last_id
+                        ):
+                            newest_id = max(newest_id, message.id)
+                            if not message.photo or message.id in downloaded_ids:
+                                progress.update(1)
+                                continue
+                            file_path = os.path.join(save_path, f"{message.id}.jpg")
+                            await queue.put((message, file_path))
+                    finally:
+                        # One sentinel per worker so that each of them stops
+                        for _ in workers:
+                            await queue.put(None)
+                        found_photos = sum(await asyncio.gather(*workers))
+                        await state_writer.close()
 
             logger.info(f"Downloaded {found_photos} out of {total_photos} photos from topic '{topic_title}'.")
-            # Save progress after processing each topic
-            save_downloaded_photos(DOWNLOADED_PHOTOS_FILE, downloaded_photos)
+            # Compact the appended progress once per topic
+            save_downloaded_photos(DOWNLOADED_PHOTOS_FILE, downloaded_ids)
+
+            # Everything below the oldest failed photo has been handled, so later runs can start there
+            if failed_ids:
+                last_id = max(last_id, min(failed_ids) - 1)
+            else:
+                last_id = max(last_id, newest_id)
+            topic_progress[progress_key] = last_id
+            save_topic_progress(TOPIC_PROGRESS_FILE, topic_progress)
 
     except Exception as e:
         logger.error(f"Error during photo download: {e}")
     finally:
-        client.disconnect()
+        await client.disconnect()
+
+
+async def main(api_id, api_hash, phone_number, chat_id, topics, downloaded_ids, topic_progress,
+               max_concurrent_downloads):
+    """
+    Create the Telegram client inside the running event loop and download all topics.
+    """
+    client = TelegramClient("session", api_id, api_hash)
+    await download_photos(client, phone_number, chat_id, topics, downloaded_ids, topic_progress,
+                          max_concurrent_downloads)
 
 
 if __name__ == "__main__":
@@ -184,13 +457,17 @@ if __name__ == "__main__":
     phone_number = config.get('phone_number')
     chat_id = int(config.get('chat_id', 0))
     topics = config.get('topics', [])
+    max_concurrent_downloads = int(config.get('max_concurrent_downloads', DEFAULT_MAX_CONCURRENT_DOWNLOADS))
 
     if not all([api_id, api_hash, phone_number, chat_id]):
         logger.error("Missing required configuration parameters.")
         exit(1)
 
-    downloaded_photos = load_downloaded_photos(DOWNLOADED_PHOTOS_FILE)
+    downloaded_ids = load_downloaded_photos(DOWNLOADED_PHOTOS_FILE)
+    # Rewrite the state as a compact, newline-terminated list before anything is appended,
+    # so appended lines never join a legacy document or a half-written line
+    save_downloaded_photos(DOWNLOADED_PHOTOS_FILE, downloaded_ids)
+    topic_progress = load_topic_progress(TOPIC_PROGRESS_FILE)
 
-    # Initialize Telegram client with a session name
-    client = TelegramClient("session", api_id, api_hash)
-    download_photos(client, phone_number, chat_id, topics, downloaded_photos)
+    asyncio.run(main(api_id, api_hash, phone_number, chat_id, topics, downloaded_ids, topic_progress,
+                     max_concurrent_downloads))
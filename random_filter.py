@@ -3,9 +3,11 @@ import sys
 import json
 import random
 import logging
-from typing import Any, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, Tuple
+import cv2
 import numpy as np
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image, ImageEnhance
 
 # Configure logging
 logging.basicConfig(
@@ -15,6 +17,15 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 CONFIG_FILE = "config.json"
+SUPPORTED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp")
+
+# ITU-R 601-2 luma weights, the same ones PIL uses for "L" conversion
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114])
+# Pixels per band processed at once by adjust_colors
+COLOR_BAND_PIXELS = 1 << 18
+
+# NumPy random generator used for the noise effect
+RNG = np.random.default_rng()
 
 
 def load_config(config_file: str) -> Dict[str, Any]:
@@ -36,53 +47,117 @@ if not folder_path:
     sys.exit(1)
 
 
-def remove_old_filtered_images(folder: str) -> None:
-    """
-    Remove all files containing '_filtered' in their name from the specified folder and its subfolders.
+def walk_once(folder: str) -> Iterator[Tuple[str, str]]:
     """
-    for root, _, files in os.walk(folder):
-        for file in files:
-            if "_filtered" in file:
-                file_path = os.path.join(root, file)
-                try:
-                    os.remove(file_path)
-                    logger.info("Removed old file: %s", file_path)
-                except Exception as e:
-                    logger.error("Error removing file %s: %s", file_path, e)
+    Walk the folder and its subfolders once with os.scandir.
 
-
-def adjust_white_balance(img: Image.Image, red_factor: float, blue_factor: float) -> Image.Image:
+    Files containing '_filtered' in their name are removed on the way, and for every
+    directory with supported images a (directory, longest image filename) pair is yielded.
     """
-    Adjust white balance by modifying red and blue channels.
-    Clamps the values to a maximum of 255.
+    stack = [folder]
+    while stack:
+        root = stack.pop()
+        longest_name = None
+        try:
+            entries = os.scandir(root)
+        except OSError as e:
+            logger.error("Error reading folder %s: %s", root, e)
+            continue
+        with entries:
+            for entry in entries:
+                name = entry.name
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        stack.append(entry.path)
+                    continue
+                if "_filtered" in name:
+                    try:
+                        os.remove(entry.path)
+                        logger.info("Removed old file: %s", entry.path)
+                    except Exception as e:
+                        logger.error("Error removing file %s: %s", entry.path, e)
+                    continue
+                if name.lower().endswith(SUPPORTED_EXTENSIONS) and (
+                        longest_name is None or len(name) > len(longest_name)):
+                    longest_name = name
+        if longest_name is not None:
+            yield root, longest_name
+
+
+def white_balance_matrix(red_factor: float, blue_factor: float) -> np.ndarray:
+    """
+    Build the color matrix that scales the red and blue channels.
 
-    :param img: PIL.Image in RGB mode.
     :param red_factor: Multiplier for red channel.
     :param blue_factor: Multiplier for blue channel.
-    :return: Image with adjusted white balance.
+    :return: 3x3 matrix applied to RGB row vectors.
     """
-    r, g, b = img.split()
-    r = r.point(lambda i: min(255, i * red_factor))
-    b = b.point(lambda i: min(255, i * blue_factor))
-    return Image.merge("RGB", (r, g, b))
+    return np.diag([red_factor, 1.0, blue_factor])
 
 
-def adjust_hue(img: Image.Image, hue_factor: float) -> Image.Image:
+def hue_rotation_matrix(hue_factor: float) -> np.ndarray:
     """
-    Adjust the hue of the image by shifting the H channel.
+    Build the color matrix that shifts the hue by rotating colors around the gray axis.
 
-    :param img: PIL.Image in RGB mode.
     :param hue_factor: Float in range [-0.05, 0.05] indicating the hue shift fraction.
-    :return: Image with adjusted hue.
+    :return: 3x3 matrix applied to RGB row vectors.
+    """
+    theta = 2 * np.pi * hue_factor
+    cos, sin = np.cos(theta), np.sin(theta)
+    cross = np.array([[0, -1, 1], [1, 0, -1], [-1, 1, 0]])
+    rotation = cos * np.eye(3) + (1 - cos) / 3 * np.ones((3, 3)) + sin / np.sqrt(3) * cross
+    return rotation.T
+
+
+def adjust_colors(img: Image.Image, red_factor: float, blue_factor: float, hue_factor: float,
+                  brightness: float, contrast: float, color: float) -> Image.Image:
+    """
+    Apply white balance, hue shift, brightness, contrast and color saturation in a single pass.
+
+    Every step is an affine color transform, so they are composed into one 3x3 matrix
+    and bias and applied to the pixels at once. Brightness, contrast and color blend
+    toward black, the mean gray level and the grayscale image as ImageEnhance does.
+
+    :param img: PIL.Image in RGB mode.
+    :param red_factor: Multiplier for red channel.
+    :param blue_factor: Multiplier for blue channel.
+    :param hue_factor: Hue shift as a fraction of the full color circle.
+    :param brightness: Brightness enhancement factor.
+    :param contrast: Contrast enhancement factor.
+    :param color: Color saturation enhancement factor.
+    :return: Image with adjusted colors.
     """
-    hsv = img.convert("HSV")
-    h, s, v = hsv.split()
-    np_h = np.array(h, dtype=np.uint8)
-    offset = int(hue_factor * 255)
-    np_h = (np_h.astype(int) + offset) % 256
-    h = Image.fromarray(np_h.astype("uint8"), "L")
-    hsv = Image.merge("HSV", (h, s, v))
-    return hsv.convert("RGB")
+    arr = np.asarray(img, dtype=np.uint8)
+
+    matrix = white_balance_matrix(red_factor, blue_factor) @ hue_rotation_matrix(hue_factor)
+    matrix *= brightness
+
+    # The contrast pivot is the mean gray level after the previous steps;
+    # a sparse pixel sample is enough to estimate it
+    mean_rgb = arr[::8, ::8].reshape(-1, 3).mean(axis=0)
+    mean_gray = float(mean_rgb @ matrix @ LUMA_WEIGHTS)
+    bias = np.full(3, (1 - contrast) * mean_gray)
+    matrix *= contrast
+
+    saturation = color * np.eye(3) + (1 - color) * np.outer(LUMA_WEIGHTS, np.ones(3))
+    matrix = matrix @ saturation
+    bias = bias @ saturation
+
+    # Work on bands of rows so the float32 temporaries stay small and the
+    # result is written straight into a uint8 buffer
+    matrix = matrix.astype(np.float32)
+    bias = bias.astype(np.float32)
+    out = np.empty_like(arr)
+    band_rows = max(1, COLOR_BAND_PIXELS // arr.shape[1])
+    for top in range(0, arr.shape[0], band_rows):
+        src = arr[top:top + band_rows]
+        band = src.reshape(-1, 3).astype(np.float32) @ matrix
+        band += bias
+        # Round like the PIL enhancers instead of truncating when casting to uint8
+        np.rint(band, out=band)
+        np.clip(band, 0, 255, out=band)
+        out[top:top + band_rows] = band.reshape(src.shape)
+    return Image.fromarray(out, "RGB")
 
 
 def apply_random_effects(img: Image.Image) -> Image.Image:
@@ -91,22 +166,30 @@ def apply_random_effects(img: Image.Image) -> Image.Image:
     - Slight random rotation (-2 to 2 degrees)
     - Random Gaussian blur with 50% chance
     - Addition of Gaussian noise
+    Rotation and blur run on the pixel array with OpenCV.
     """
-    # Apply slight random rotation
+    arr = np.ascontiguousarray(np.asarray(img, dtype=np.uint8))
+    height, width = arr.shape[:2]
+
+    # Apply slight random rotation (counter-clockwise, black corners, like Image.rotate)
     angle = random.uniform(-2, 2)
-    img = img.rotate(angle, resample=Image.BICUBIC, expand=False)
+    matrix = cv2.getRotationMatrix2D(((width - 1) / 2, (height - 1) / 2), angle, 1.0)
+    arr = cv2.warpAffine(arr, matrix, (width, height), flags=cv2.INTER_CUBIC,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=0)
 
     # Randomly apply Gaussian blur
     if random.random() < 0.5:
         radius = random.uniform(0.2, 1.0)
-        img = img.filter(ImageFilter.GaussianBlur(radius=radius))
+        arr = cv2.GaussianBlur(arr, (0, 0), sigmaX=radius)
 
-    # Add Gaussian noise
-    np_img = np.array(img).astype("float32")
+    # Add Gaussian noise (float32 noise added in place)
+    np_img = arr.astype(np.float32)
     sigma = random.uniform(5, 15)
-    noise = np.random.normal(0, sigma, np_img.shape)
-    np_img = np.clip(np_img + noise, 0, 255).astype("uint8")
-    return Image.fromarray(np_img)
+    noise = RNG.standard_normal(np_img.shape, dtype=np.float32)
+    noise *= sigma
+    np.add(np_img, noise, out=np_img)
+    np.clip(np_img, 0, 255, out=np_img)
+    return Image.fromarray(np_img.astype(np.uint8))
 
 
 def apply_filters(image: Image.Image) -> Image.Image:
@@ -119,23 +202,17 @@ def apply_filters(image: Image.Image) -> Image.Image:
     """
     img = image.convert("RGB")
 
-    # Adjust white balance with random factors
+    # Random white balance factors and a slight hue shift
     red_factor = random.uniform(0.98, 1.02)
     blue_factor = random.uniform(0.98, 1.02)
-    img = adjust_white_balance(img, red_factor, blue_factor)
-
-    # Apply a slight random hue shift
     hue_shift = random.uniform(-0.05, 0.05)
-    img = adjust_hue(img, hue_shift)
 
     # Enhance brightness, contrast, color, and sharpness
     brightness = random.uniform(0.8, 0.9)
     contrast = random.uniform(1.05, 1.15)
     color = random.uniform(0.9, 1.15)
     sharpness = random.uniform(0.95, 1.2)
-    img = ImageEnhance.Brightness(img).enhance(brightness)
-    img = ImageEnhance.Contrast(img).enhance(contrast)
-    img = ImageEnhance.Color(img).enhance(color)
+    img = adjust_colors(img, red_factor, blue_factor, hue_shift, brightness, contrast, color)
     img = ImageEnhance.Sharpness(img).enhance(sharpness)
 
     # Apply additional random effects
@@ -143,38 +220,46 @@ def apply_filters(image: Image.Image) -> Image.Image:
     return img
 
 
+def init_worker() -> None:
+    """
+    Give every worker process its own random state so forked workers do not share noise.
+    """
+    global RNG
+    RNG = np.random.default_rng()
+    random.seed()
+
+
+def filter_image(image_path: str) -> None:
+    """
+    Apply filters to a single image and save it with a '_filtered' suffix.
+    """
+    try:
+        with Image.open(image_path) as img:
+            filtered_img = apply_filters(img)
+            base, ext = os.path.splitext(image_path)
+            new_image_path = f"{base}_filtered{ext}"
+            filtered_img.save(new_image_path)
+            logger.info("Processed and saved: %s", new_image_path)
+    except Exception as e:
+        logger.error("Error processing image %s: %s", image_path, e)
+
+
 def process_images(folder: str) -> None:
     """
     Process images in the given folder:
     - Remove previously filtered images.
     - For each subfolder, select the image with the longest filename.
-    - Apply filters and save the modified image with a '_filtered' suffix.
+    - Apply filters in parallel worker processes and save the modified images with a '_filtered' suffix.
     """
     if not os.path.exists(folder):
         logger.error("Folder '%s' does not exist.", folder)
         return
 
-    remove_old_filtered_images(folder)
+    # Old filtered images are removed during the same traversal
+    image_paths = [os.path.join(root, name) for root, name in walk_once(folder)]
 
-    supported_extensions = (".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp")
-    for root, _, files in os.walk(folder):
-        image_files = [f for f in files if f.lower().endswith(supported_extensions)]
-        if not image_files:
-            continue
-
-        # Select image with the longest filename
-        longest_name_file = max(image_files, key=len)
-        image_path = os.path.join(root, longest_name_file)
-
-        try:
-            with Image.open(image_path) as img:
-                filtered_img = apply_filters(img)
-                base, ext = os.path.splitext(image_path)
-                new_image_path = f"{base}_filtered{ext}"
-                filtered_img.save(new_image_path)
-                logger.info("Processed and saved: %s", new_image_path)
-        except Exception as e:
-            logger.error("Error processing image %s: %s", image_path, e)
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=init_worker) as executor:
+        list(executor.map(filter_image, image_paths))
 
 
 if __name__ == "__main__":
@@ -1,9 +1,13 @@
+import io
 import os
 import re
 import json
 import sys
 import logging
+import argparse
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Optional, List
 from pptx import Presentation
 from pptx.util import Inches, Pt
@@ -11,7 +15,12 @@ from pptx.enum.text import PP_ALIGN, MSO_ANCHOR
 from pptx.dml.color import RGBColor
 import win32com.client  # For converting PPTX to PDF
 from natsort import natsorted
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageFont
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library if orjson is not installed
+    orjson = None
 
 # Constants
 FONT_PATH = r"C:\Windows\Fonts\times.ttf"  # Path to Times New Roman font file
@@ -22,6 +31,11 @@ PHOTO_WIDTH = Inches(9.8 * CM_TO_INCH)
 PHOTO_HEIGHT = Inches(13.06 * CM_TO_INCH)
 PHOTO_TOP = Inches(4.72 * CM_TO_INCH)
 
+# Photos are downscaled to this resolution before being embedded into the presentation
+PHOTO_DPI = 150
+PHOTO_SIZE_PX = (round(9.8 * CM_TO_INCH * PHOTO_DPI), round(13.06 * CM_TO_INCH * PHOTO_DPI))
+PHOTO_JPEG_QUALITY = 85
+
 # Fixed horizontal positions for 3 columns (in inches)
 FIXED_PHOTO_LEFTS = [
     Inches(1.32 * CM_TO_INCH),
@@ -38,6 +52,13 @@ LABEL_MARGIN_BOTTOM = Inches(0.13 * CM_TO_INCH)
 LABEL_FONT_FAMILY = "Times New Roman"
 LABEL_FONT_SIZE = 28  # Maximum font size in points
 
+# Available label text area in points (1 inch = 72 pt)
+LABEL_AVAILABLE_WIDTH_PT = (9.8 * CM_TO_INCH * 72) - ((0.25 * CM_TO_INCH * 72) * 2)
+LABEL_AVAILABLE_HEIGHT_PT = (2.0 * CM_TO_INCH * 72) - ((0.13 * CM_TO_INCH * 72) * 2)
+
+PHOTO_EXTENSIONS = frozenset({"jpg", "jpeg", "png"})
+LEADING_NUMBER_RE = re.compile(r'^(\d+)')
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -46,19 +67,21 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
 def extract_number(text: str) -> int:
     """
     Extracts a leading number from a string for sorting.
     """
-    match = re.match(r'^(\d+)', text)
+    match = LEADING_NUMBER_RE.match(text)
     return int(match.group(1)) if match else 999999
 
 
+@lru_cache(maxsize=None)
 def extract_photo_number(filename: str) -> int:
     """
     Extracts a leading number from a filename for sorting.
     """
-    match = re.match(r'^(\d+)', filename)
+    match = LEADING_NUMBER_RE.match(filename)
     return int(match.group(1)) if match else 999999
 
 
@@ -75,25 +98,35 @@ def extract_date_from_folder(folder_name: str) -> Optional[datetime.datetime]:
     return None
 
 
+@lru_cache(maxsize=64)
+def load_font(font_path: str, size: int) -> ImageFont.ImageFont:
+    """
+    Loads a TrueType font of the given size, falling back to Pillow's default font.
+    Fonts are cached so each (path, size) pair is parsed only once.
+    """
+    try:
+        return ImageFont.truetype(font_path, size)
+    except IOError:
+        return ImageFont.load_default()
+
+
 def shrink_text_to_fit(text: str, available_width_pt: float, available_height_pt: float,
                        font_path: str, max_font_size: int, min_font_size: int = 8) -> int:
     """
-    Iteratively decreases the font size until the text fits within the available width and height.
-    Uses Pillow's textbbox method for measuring text dimensions.
+    Finds the largest font size at which the text fits within the available width and height.
+    Since the text size grows with the font size, the sizes are binary searched.
+    Width is measured with Pillow's getlength, height with the font's ascent and descent.
     """
-    image = Image.new("RGB", (int(available_width_pt), int(available_height_pt)))
-    draw = ImageDraw.Draw(image)
-    for size in range(max_font_size, min_font_size - 1, -1):
-        try:
-            font = ImageFont.truetype(font_path, size)
-        except IOError:
-            font = ImageFont.load_default()
-        bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-        if text_width <= available_width_pt and text_height <= available_height_pt:
-            return size
-    return min_font_size
+    lo, hi = min_font_size, max_font_size
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        font = load_font(font_path, mid)
+        ascent, descent = font.getmetrics()
+        if font.getlength(text) <= available_width_pt and ascent + descent <= available_height_pt:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
 
 
 # -----------------------------
@@ -101,8 +134,9 @@ def shrink_text_to_fit(text: str, available_width_pt: float, available_height_pt
 # -----------------------------
 CONFIG_FILE = "config.json"
 try:
-    with open(CONFIG_FILE, "r", encoding="utf-8") as config_file:
-        config = json.load(config_file)
+    with open(CONFIG_FILE, "rb") as config_file:
+        config_data = config_file.read()
+    config = orjson.loads(config_data) if orjson is not None else json.loads(config_data)
 except Exception as e:
     logger.error("Error loading configuration: %s", e)
     sys.exit(1)
@@ -141,10 +175,34 @@ def add_title_slide(prs: Presentation, title_text: str) -> None:
     logger.info("Title slide added.")
 
 
-def add_photo_with_label(slide, photo_path: str, left, photo_top, label_text: str) -> None:
+@lru_cache(maxsize=128)
+def prepare_photo(photo_path: str, mtime: float) -> bytes:
+    """
+    Returns JPEG bytes of the photo resized to the slide photo size.
+    Photos that are already small enough are embedded unchanged.
+    The modification time is part of the cache key so edited files are reloaded.
+    """
+    with Image.open(photo_path) as img:
+        if img.width <= PHOTO_SIZE_PX[0] and img.height <= PHOTO_SIZE_PX[1]:
+            with open(photo_path, "rb") as f:
+                return f.read()
+        resized = img.convert("RGB").resize(PHOTO_SIZE_PX, Image.LANCZOS)
+    buffer = io.BytesIO()
+    resized.save(buffer, "JPEG", quality=PHOTO_JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def load_slide_photo(photo_path: str) -> bytes:
     """
-    Adds a photo with a header label above it.
-    The header text is resized to optimally fit the designated area.
+    Returns the downscaled photo bytes, keyed by the file's current modification time.
+    """
+    return prepare_photo(photo_path, os.path.getmtime(photo_path))
+
+
+def add_photo_with_label(slide, photo_data: bytes, left, photo_top, label_text: str, font_size: int) -> None:
+    """
+    Adds a prepared photo with a header label above it.
+    The header text uses the precomputed font size that fits the designated area.
     """
     label_top = photo_top - LABEL_HEIGHT
     textbox = slide.shapes.add_textbox(left, label_top, PHOTO_WIDTH, LABEL_HEIGHT)
@@ -157,34 +215,47 @@ def add_photo_with_label(slide, photo_path: str, left, photo_top, label_text: st
     tf.margin_top = LABEL_MARGIN_TOP
     tf.margin_bottom = LABEL_MARGIN_BOTTOM
 
-    # Calculate available width and height in points (1 inch = 72 pt)
-    available_width_pt = (9.8 * CM_TO_INCH * 72) - ((0.25 * CM_TO_INCH * 72) * 2)
-    available_height_pt = (2.0 * CM_TO_INCH * 72) - ((0.13 * CM_TO_INCH * 72) * 2)
-    optimal_font_size = shrink_text_to_fit(label_text, available_width_pt, available_height_pt,
-                                           FONT_PATH, LABEL_FONT_SIZE)
-    logger.info("For text '%s', optimal font size: %d pt", label_text, optimal_font_size)
-
     p = tf.paragraphs[0]
     p.text = label_text
     p.alignment = PP_ALIGN.CENTER
     p.font.name = LABEL_FONT_FAMILY
-    p.font.size = Pt(optimal_font_size)
+    p.font.size = Pt(font_size)
 
-    # Add the photo to the slide
-    slide.shapes.add_picture(photo_path, left, photo_top, width=PHOTO_WIDTH, height=PHOTO_HEIGHT)
+    # Add the downscaled photo to the slide
+    slide.shapes.add_picture(io.BytesIO(photo_data), left, photo_top, width=PHOTO_WIDTH, height=PHOTO_HEIGHT)
 
 
-def convert_pptx_to_pdf(pptx_path: str, pdf_path: str) -> None:
+class PowerPointSession:
     """
-    Converts a PPTX file to PDF using win32com.
+    Context manager that keeps one PowerPoint COM instance open,
+    so several PPTX files can be converted without restarting PowerPoint.
+    """
+
+    def __init__(self) -> None:
+        self.app = None
+
+    def __enter__(self) -> "PowerPointSession":
+        self.app = win32com.client.Dispatch("PowerPoint.Application")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self.app is not None:
+            try:
+                self.app.Quit()
+            except Exception as e:
+                logger.warning("Error closing PowerPoint: %s", e)
+            self.app = None
+
+
+def convert_pptx_to_pdf(session: PowerPointSession, pptx_path: str, pdf_path: str) -> None:
+    """
+    Converts a PPTX file to PDF using the PowerPoint instance of an open session.
+    The presentation is opened without a window.
     """
     try:
-        powerpoint = win32com.client.Dispatch("PowerPoint.Application")
-        powerpoint.Visible = 1
-        presentation = powerpoint.Presentations.Open(pptx_path, WithWindow=False)
+        presentation = session.app.Presentations.Open(pptx_path, WithWindow=False)
         presentation.SaveAs(pdf_path, 32)  # 32 corresponds to ppSaveAsPDF
         presentation.Close()
-        powerpoint.Quit()
         logger.info("PDF saved: %s", pdf_path)
     except Exception as e:
         logger.error("Error converting PPTX to PDF: %s", e)
@@ -196,16 +267,17 @@ def get_unique_photos_in_folder(folder: str) -> List[str]:
     from the given folder. For each group (based on the prefix before '_'),
     the longest filename is chosen.
     """
-    files = [
-        f for f in os.listdir(folder)
-        if f.lower().endswith(('.jpg', '.jpeg', '.png')) and "_stamped" in f.lower()
-    ]
     groups: dict[str, str] = {}
-    for f in files:
-        key = f.split("_")[0]
-        current = groups.get(key)
-        if current is None or len(f) > len(current):
-            groups[key] = f
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            name = entry.name
+            name_lower = name.lower()
+            if "_stamped" not in name_lower or name_lower.rpartition(".")[2] not in PHOTO_EXTENSIONS:
+                continue
+            key = name.split("_", 1)[0]
+            current = groups.get(key)
+            if current is None or len(name) > len(current):
+                groups[key] = name
     unique_files = [os.path.join(folder, f) for f in groups.values()]
     return natsorted(unique_files, key=lambda x: extract_photo_number(os.path.basename(x)))
 
@@ -213,11 +285,23 @@ def get_unique_photos_in_folder(folder: str) -> List[str]:
 def get_leaf_folders(root: str) -> List[str]:
     """
     Recursively finds and returns leaf folders (directories with no subdirectories).
+    Uses an os.scandir depth-first search that only inspects directory entries
+    and yields folders in the same order as os.walk.
     """
     leaf_folders = []
-    for dirpath, dirnames, _ in os.walk(root):
-        if not dirnames:
-            leaf_folders.append(dirpath)
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            with os.scandir(path) as entries:
+                subdirs = [e.path for e in entries if e.is_dir(follow_symlinks=False)]
+        except OSError as e:
+            logger.warning("Cannot read folder '%s': %s", path, e)
+            continue
+        if subdirs:
+            stack.extend(reversed(subdirs))
+        else:
+            leaf_folders.append(path)
     return leaf_folders
 
 
@@ -256,6 +340,19 @@ def create_photo_report_presentation(root_path: str, output_path: str) -> None:
     all_photos.sort(key=lambda x: (x[0], x[1]))
     logger.info("Total photos collected: %d", len(all_photos))
 
+    # Resizing photos is independent per photo and PIL releases the GIL, so do it in threads;
+    # python-pptx itself is not thread-safe and the slides are assembled serially below
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        photo_data = list(executor.map(load_slide_photo, [photo for _, _, photo, _ in all_photos]))
+
+    # Labels repeat for every photo of a folder, so fit each one once
+    font_sizes = {}
+    for _, _, _, work_name in all_photos:
+        if work_name not in font_sizes:
+            font_sizes[work_name] = shrink_text_to_fit(work_name, LABEL_AVAILABLE_WIDTH_PT,
+                                                       LABEL_AVAILABLE_HEIGHT_PT, FONT_PATH, LABEL_FONT_SIZE)
+            logger.debug("For text '%s', optimal font size: %d pt", work_name, font_sizes[work_name])
+
     # Calculate the number of slides (3 photos per slide)
     num_slides = (len(all_photos) + 2) // 3
     for slide_idx in range(num_slides):
@@ -280,9 +377,11 @@ def create_photo_report_presentation(root_path: str, output_path: str) -> None:
         elif n == 1:
             positions = [(prs.slide_width - PHOTO_WIDTH) / 2]
 
-        for i, (_, _, photo_path, work_name) in enumerate(group):
-            add_photo_with_label(slide, photo_path, positions[i], photo_top, work_name)
-        logger.info("Created slide %d with %d photos.", slide_idx + 1, n)
+        for i, (_, _, _, work_name) in enumerate(group):
+            add_photo_with_label(slide, photo_data[slide_idx * 3 + i], positions[i], photo_top,
+                                 work_name, font_sizes[work_name])
+        logger.debug("Created slide %d with %d photos.", slide_idx + 1, n)
+    logger.info("Created %d photo slide(s).", num_slides)
 
     # Ensure the output directory exists
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -295,19 +394,25 @@ def create_photo_report_presentation(root_path: str, output_path: str) -> None:
 
     pdf_path = os.path.splitext(output_path)[0] + ".pdf"
     try:
-        convert_pptx_to_pdf(output_path, pdf_path)
+        with PowerPointSession() as session:
+            convert_pptx_to_pdf(session, output_path, pdf_path)
     except Exception as e:
         logger.error("Error converting to PDF: %s", e)
 
 
-def main() -> None:
+def main(verbose: bool = False) -> None:
     """
     Main entry point for creating the photo report presentation.
+    With verbose=True, every created slide is logged as well.
     """
+    if verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
     logger.info("Starting presentation creation...")
     create_photo_report_presentation(folder_path, output_path)
     logger.info("Process completed.")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Create the daily photo report presentation.")
+    parser.add_argument("--verbose", action="store_true", help="Log every created slide")
+    main(parser.parse_args().verbose)
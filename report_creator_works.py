@@ -2,14 +2,20 @@ import os
 import re
 import json
 import sys
+import shutil
+import argparse
 import logging
-from typing import List
+import tempfile
+from functools import lru_cache
+from typing import List, Optional
 from pptx import Presentation
 from pptx.util import Inches, Pt
 from pptx.enum.text import PP_ALIGN, MSO_ANCHOR
 from pptx.dml.color import RGBColor
+from pptx.opc.packuri import PackURI
+from pptx.package import Package
 import win32com.client  # For converting PPTX to PDF
-from PIL import Image, ImageDraw, ImageFont
+from PIL import ImageFont
 
 # -----------------------------
 # Constants and Parameters
@@ -23,6 +29,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# -----------------------------
+# python-pptx image partname counter
+# -----------------------------
+# python-pptx rescans every part of the package each time it names a new image,
+# which makes adding pictures quadratic in the size of the deck. The patched method
+# scans the existing media parts once per package, then keeps counting. It assumes
+# parts are only ever appended: unlike python-pptx, it never fills gaps left by
+# removed images, it just continues after the highest index in use.
+IMAGE_PARTNAME_PREFIX = "/ppt/media/image"
+
+
+def _next_image_partname(self, ext):
+    idx = self.__dict__.get("_next_image_idx")
+    if idx is None:
+        idxs = [
+            part.partname.idx for part in self.iter_parts()
+            if part.partname.startswith(IMAGE_PARTNAME_PREFIX) and part.partname.idx is not None
+        ]
+        idx = max(idxs, default=0) + 1
+    self._next_image_idx = idx + 1
+    return PackURI("%s%d.%s" % (IMAGE_PARTNAME_PREFIX, idx, ext))
+
+
+Package.next_image_partname = _next_image_partname
+
+
 CM_TO_INCH = 1 / 2.54
 
 # Photo sizes in inches (converted from centimeters)
@@ -38,6 +70,9 @@ LABEL_MARGIN_BOTTOM = Inches(0.13 * CM_TO_INCH)
 LABEL_FONT_FAMILY = "Times New Roman"
 LABEL_FONT_SIZE = 28  # Maximum font size for label
 
+# Photo formats picked up from the report folders
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+
 # Gap between photos on slide
 GAP = Inches(0.5)
 
@@ -45,6 +80,13 @@ GAP = Inches(0.5)
 SLIDE_WIDTH = Inches(13.33)
 SLIDE_HEIGHT = Inches(7.5)
 
+# Number of slides built in memory before they are saved as a chunk
+SLIDES_PER_CHUNK = 100
+
+# Numeric prefix of work folder names, e.g. "01 Example"
+FOLDER_NUMBER_RE = re.compile(r'^(\d+)')
+FOLDER_NUMBER_PREFIX_RE = re.compile(r'^\d+\s*')
+
 
 # -----------------------------
 # Helper Functions
@@ -54,7 +96,7 @@ def extract_folder_number(folder_name: str) -> int:
     Extracts the numeric prefix from a folder name for sorting.
     E.g., "01 Example" returns 1.
     """
-    match = re.match(r'^(\d+)', folder_name)
+    match = FOLDER_NUMBER_RE.match(folder_name)
     return int(match.group(1)) if match else 999999
 
 
@@ -63,58 +105,128 @@ def extract_folder_label(folder_name: str) -> str:
     Returns the folder name without its numeric prefix.
     E.g., "01 Example" becomes "Example".
     """
-    return re.sub(r'^\d+\s*', '', folder_name)
+    return FOLDER_NUMBER_PREFIX_RE.sub('', folder_name)
+
+
+@lru_cache(maxsize=64)
+def load_font(font_path: str, size: int) -> ImageFont.ImageFont:
+    """
+    Loads a TrueType font of the given size, falling back to Pillow's default font.
+    Fonts are cached so each (path, size) pair is parsed only once.
+    """
+    try:
+        return ImageFont.truetype(font_path, size)
+    except IOError:
+        return ImageFont.load_default()
 
 
+@lru_cache(maxsize=1024)
 def shrink_text_to_fit(text: str, available_width_pt: float, available_height_pt: float,
                        font_path: str, max_font_size: int, min_font_size: int = 8) -> int:
     """
-    Reduces the font size until the text fits within the available space.
-    Uses Pillow to measure text dimensions.
+    Finds the largest font size at which the text fits within the available space.
+    Text size grows with the font size, so the sizes are binary searched.
+    Measures text dimensions with the font's getbbox, without a drawing canvas.
+    Results are cached, since every slide of a folder repeats the same label.
     """
-    # Create a dummy image to measure text size
-    image = Image.new("RGB", (int(available_width_pt), int(available_height_pt)))
-    draw = ImageDraw.Draw(image)
-    for size in range(max_font_size, min_font_size - 1, -1):
-        try:
-            font = ImageFont.truetype(font_path, size)
-        except IOError:
-            font = ImageFont.load_default()
-        bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
+    lo, hi = min_font_size, max_font_size
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        font = load_font(font_path, mid)
+        left, top, right, bottom = font.getbbox(text)
+        text_width = right - left
+        text_height = bottom - top
         if text_width <= available_width_pt and text_height <= available_height_pt:
-            return size
-    return min_font_size
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
 
 
-def convert_pptx_to_pdf(pptx_path: str, pdf_path: str) -> None:
+class PowerPointSession:
     """
-    Converts a PPTX file to PDF using win32com.
+    Context manager that keeps one PowerPoint COM instance open,
+    so several PPTX files can be converted without restarting PowerPoint.
+    """
+
+    def __init__(self) -> None:
+        self.app = None
+
+    def __enter__(self) -> "PowerPointSession":
+        self.app = win32com.client.Dispatch("PowerPoint.Application")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self.app is not None:
+            try:
+                self.app.Quit()
+            except Exception as e:
+                logger.warning("Error closing PowerPoint: %s", e)
+            self.app = None
+
+
+def convert_pptx_to_pdf(session: PowerPointSession, pptx_path: str, pdf_path: str) -> None:
+    """
+    Converts a PPTX file to PDF using the PowerPoint instance of an open session.
+    The presentation is opened without a window.
     """
-    powerpoint = None
     try:
-        powerpoint = win32com.client.Dispatch("PowerPoint.Application")
-        powerpoint.Visible = 1
-        presentation = powerpoint.Presentations.Open(pptx_path, WithWindow=False)
+        presentation = session.app.Presentations.Open(pptx_path, WithWindow=False)
         presentation.SaveAs(pdf_path, 32)  # 32 corresponds to ppSaveAsPDF
         presentation.Close()
         logger.info("PDF saved: %s", pdf_path)
     except Exception as e:
         logger.error("Error converting PPTX to PDF: %s", e)
+
+
+def merge_presentations(session: PowerPointSession, chunk_paths: List[str], output_path: str) -> None:
+    """
+    Merges chunk presentations into one PPTX file with PowerPoint.
+    Slides of every following chunk are appended to the first one in order.
+    Paths must be absolute, since PowerPoint resolves relative paths against its own working directory.
+    """
+    presentation = session.app.Presentations.Open(chunk_paths[0], WithWindow=False)
+    try:
+        for chunk_path in chunk_paths[1:]:
+            presentation.Slides.InsertFromFile(chunk_path, presentation.Slides.Count)
+        presentation.SaveAs(output_path, 24)  # 24 corresponds to ppSaveAsOpenXMLPresentation
+        logger.info("Presentation saved: %s", output_path)
     finally:
-        if powerpoint:
-            powerpoint.Quit()
+        presentation.Close()
+
+
+def keep_chunks(chunk_paths: List[str], output_path: str) -> None:
+    """
+    Moves unmerged chunk presentations next to the output file as '<name>_part1.pptx', ...
+    so the report is not lost when PowerPoint cannot merge them.
+    """
+    base_path = os.path.splitext(output_path)[0]
+    for index, chunk_path in enumerate(chunk_paths, start=1):
+        part_path = f"{base_path}_part{index}.pptx"
+        shutil.move(chunk_path, part_path)
+        logger.info("Presentation part saved: %s", part_path)
 
 
 def get_leaf_folders(root: str) -> List[str]:
     """
     Recursively finds and returns leaf folders (folders without subdirectories).
+    Uses an os.scandir depth-first search that only inspects directory entries
+    and yields folders in the same order as os.walk.
     """
     leaf_folders = []
-    for dirpath, dirnames, _ in os.walk(root):
-        if not dirnames:
-            leaf_folders.append(dirpath)
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            with os.scandir(path) as entries:
+                subdirs = [e.path for e in entries if e.is_dir(follow_symlinks=False)]
+        except OSError as e:
+            logger.warning("Cannot read folder '%s': %s", path, e)
+            continue
+        if subdirs:
+            stack.extend(reversed(subdirs))
+        else:
+            leaf_folders.append(path)
     return leaf_folders
 
 
@@ -123,12 +235,14 @@ def get_photos_in_folder(folder: str) -> List[str]:
     Returns a list of image file paths in a folder that contain '_stamped' in their name.
     Supported formats: .jpg, .jpeg, .png.
     """
-    files = [
-        f for f in os.listdir(folder)
-        if f.lower().endswith(('.jpg', '.jpeg', '.png')) and "_stamped" in f.lower()
-    ]
-    files_sorted = sorted(files)
-    return [os.path.join(folder, f) for f in files_sorted]
+    files = []
+    with os.scandir(folder) as entries:
+        for e in entries:
+            name_lower = e.name.lower()
+            if name_lower.endswith(IMAGE_EXTS) and "_stamped" in name_lower and e.is_file():
+                files.append(e)
+    files.sort(key=lambda e: e.name)
+    return [e.path for e in files]
 
 
 def emu_to_points(emu: float) -> float:
@@ -142,11 +256,11 @@ def emu_to_points(emu: float) -> float:
 # -----------------------------
 # Presentation Creation Functions
 # -----------------------------
-def add_title_slide(prs: Presentation, title_text: str) -> None:
+def add_title_slide(prs: Presentation, title_text: str, layout) -> None:
     """
-    Adds a title slide with centered text.
+    Adds a title slide with centered text using the given slide layout.
     """
-    slide = prs.slides.add_slide(prs.slide_layouts[5])
+    slide = prs.slides.add_slide(layout)
     textbox = slide.shapes.add_textbox(0, 0, prs.slide_width, prs.slide_height)
     tf = textbox.text_frame
     tf.clear()
@@ -164,12 +278,12 @@ def add_title_slide(prs: Presentation, title_text: str) -> None:
     logger.info("Title slide added.")
 
 
-def add_slide_with_photos(prs: Presentation, photos: List[str], label_text: str) -> None:
+def add_slide_with_photos(prs: Presentation, photos: List[str], label_text: str, layout) -> None:
     """
-    Adds a slide with a header label and up to three photos.
+    Adds a slide with a header label and up to three photos using the given slide layout.
     The label is placed above the photo area.
     """
-    slide = prs.slides.add_slide(prs.slide_layouts[5])
+    slide = prs.slides.add_slide(layout)
     # Calculate block width for 3 photos and 2 gaps
     block_width = 3 * PHOTO_WIDTH + 2 * GAP
     block_left = (prs.slide_width - block_width) / 2
@@ -200,7 +314,7 @@ def add_slide_with_photos(prs: Presentation, photos: List[str], label_text: str)
     optimal_font_size = shrink_text_to_fit(label_text, available_width_pt,
                                            available_height_pt, FONT_PATH,
                                            LABEL_FONT_SIZE)
-    logger.info("For label '%s', selected font size: %d pt", label_text, optimal_font_size)
+    logger.debug("For label '%s', selected font size: %d pt", label_text, optimal_font_size)
 
     p = tf.paragraphs[0]
     p.alignment = PP_ALIGN.CENTER
@@ -218,23 +332,56 @@ def add_slide_with_photos(prs: Presentation, photos: List[str], label_text: str)
     for i, photo_path in enumerate(photos):
         left = photos_left + i * (PHOTO_WIDTH + GAP)
         slide.shapes.add_picture(photo_path, left, photos_top, width=PHOTO_WIDTH, height=PHOTO_HEIGHT)
-    logger.info("Slide created with %d photo(s) and label '%s'.", n, label_text)
+    logger.debug("Slide created with %d photo(s) and label '%s'.", n, label_text)
+
+
+def new_presentation() -> Presentation:
+    """
+    Creates an empty presentation with the report slide size.
+    """
+    prs = Presentation()
+    prs.slide_width = SLIDE_WIDTH
+    prs.slide_height = SLIDE_HEIGHT
+    return prs
+
+
+def save_chunk(prs: Presentation, chunk_dir: str, index: int) -> str:
+    """
+    Saves a chunk of the report to the temporary folder and returns its path.
+    """
+    chunk_path = os.path.join(chunk_dir, f"chunk_{index:04d}.pptx")
+    try:
+        prs.save(chunk_path)
+    except Exception as e:
+        logger.error("Error saving presentation chunk: %s", e)
+        sys.exit(1)
+    logger.info("Saved presentation chunk %d with %d slides.", index + 1, len(prs.slides))
+    return chunk_path
 
 
-def create_photo_report_presentation(root_path: str, output_path: str, title_content: str) -> None:
+def create_photo_report_presentation(root_path: str, output_path: str, title_content: str,
+                                     session: Optional[PowerPointSession] = None) -> None:
     """
     Creates a presentation with a title slide and slides for each leaf folder.
     For each leaf folder:
       - Skips folders with names containing "Лишнее" or "Запас".
       - Uses photos with '_stamped' in their names.
       - Groups photos in sets of 3 with the folder label as header.
-    After saving the presentation, it converts the file to PDF.
+    Every SLIDES_PER_CHUNK slides the presentation is saved as a temporary chunk and a new
+    one is started, keeping memory and per-slide cost bounded; PowerPoint merges the chunks.
+    After saving the presentation, it converts the file to PDF, reusing the given
+    PowerPoint session if there is one or starting a new one otherwise.
     """
-    prs = Presentation()
-    prs.slide_width = SLIDE_WIDTH
-    prs.slide_height = SLIDE_HEIGHT
+    prs = new_presentation()
+
+    # Look up the layout once; every slide uses it
+    blank_layout = prs.slide_layouts[5]
+    add_title_slide(prs, title_content, blank_layout)
 
-    add_title_slide(prs, title_content)
+    # Large reports are built in chunks that are saved to a temporary folder
+    # and merged by PowerPoint afterwards
+    chunk_dir = None
+    chunk_paths = []
 
     leaf_folders = get_leaf_folders(root_path)
     sorted_folders = sorted(leaf_folders, key=lambda f: extract_folder_number(os.path.basename(f)))
@@ -254,10 +401,38 @@ def create_photo_report_presentation(root_path: str, output_path: str, title_con
 
         # Group photos in sets of 3 per slide
         for i in range(0, len(photos), 3):
+            if len(prs.slides) >= SLIDES_PER_CHUNK:
+                chunk_dir = chunk_dir or tempfile.mkdtemp(prefix="report_chunks_")
+                chunk_paths.append(save_chunk(prs, chunk_dir, len(chunk_paths)))
+                prs = new_presentation()
+                blank_layout = prs.slide_layouts[5]
             group = photos[i:i + 3]
-            add_slide_with_photos(prs, group, folder_label)
+            add_slide_with_photos(prs, group, folder_label, blank_layout)
+        logger.info("Folder '%s': %d photo(s) added.", folder_name, len(photos))
 
+    # PowerPoint resolves relative paths against its own working directory
+    output_path = os.path.abspath(output_path)
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    pdf_path = os.path.splitext(output_path)[0] + ".pdf"
+
+    if chunk_paths:
+        chunk_paths.append(save_chunk(prs, chunk_dir, len(chunk_paths)))
+        try:
+            if session is not None:
+                merge_presentations(session, chunk_paths, output_path)
+                convert_pptx_to_pdf(session, output_path, pdf_path)
+            else:
+                with PowerPointSession() as own_session:
+                    merge_presentations(own_session, chunk_paths, output_path)
+                    convert_pptx_to_pdf(own_session, output_path, pdf_path)
+        except Exception as e:
+            logger.error("Error merging presentation chunks: %s", e)
+            keep_chunks(chunk_paths, output_path)
+            logger.error("The report was saved in %d parts next to %s.", len(chunk_paths), output_path)
+        finally:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+        return
+
     try:
         prs.save(output_path)
         logger.info("Presentation saved: %s", output_path)
@@ -265,17 +440,23 @@ def create_photo_report_presentation(root_path: str, output_path: str, title_con
         logger.error("Error saving presentation: %s", e)
         sys.exit(1)
 
-    pdf_path = os.path.splitext(output_path)[0] + ".pdf"
     try:
-        convert_pptx_to_pdf(output_path, pdf_path)
+        if session is not None:
+            convert_pptx_to_pdf(session, output_path, pdf_path)
+        else:
+            with PowerPointSession() as own_session:
+                convert_pptx_to_pdf(own_session, output_path, pdf_path)
     except Exception as e:
         logger.error("Error converting to PDF: %s", e)
 
 
-def main() -> None:
+def main(verbose: bool = False) -> None:
     """
     Main function to generate the presentation from a configuration file.
+    With verbose=True, every created slide is logged as well.
     """
+    if verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
     CONFIG_FILE = "config.json"
     try:
         with open(CONFIG_FILE, "r", encoding="utf-8") as config_file:
@@ -298,4 +479,6 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Create the work photo report presentation.")
+    parser.add_argument("--verbose", action="store_true", help="Log every created slide")
+    main(parser.parse_args().verbose)
@@ -0,0 +1,50 @@
+import json
+import os
+import tempfile
+import unittest
+
+try:
+    import downloader
+except ImportError:  # telethon, aiofiles and tqdm are needed to import the module
+    downloader = None
+
+
+@unittest.skipIf(downloader is None, "downloader dependencies are not installed")
+class DownloadedPhotosStateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.state_file = os.path.join(self.tmp_dir.name, "downloaded_photos.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_legacy_state(self, ids):
+        # The old format: an indented dict keyed by photo paths, without a trailing newline
+        legacy = {f"downloads/chat/topic/{message_id}.jpg": True for message_id in ids}
+        with open(self.state_file, "w", encoding="utf-8") as f:
+            json.dump(legacy, f, indent=4)
+
+    def append_ids(self, *ids):
+        with open(self.state_file, "ab") as f:
+            for message_id in ids:
+                f.write(downloader.json_dumps(message_id) + b"\n")
+
+    def test_legacy_state_is_normalised_before_appending(self):
+        self.write_legacy_state([5, 7])
+        downloaded_ids = downloader.load_downloaded_photos(self.state_file)
+        self.assertEqual(downloaded_ids, {5, 7})
+
+        downloader.save_downloaded_photos(self.state_file, downloaded_ids)
+        self.append_ids(9, 11)
+        self.assertEqual(downloader.load_downloaded_photos(self.state_file), {5, 7, 9, 11})
+
+    def test_unterminated_last_line_is_ignored(self):
+        downloader.save_downloaded_photos(self.state_file, {1, 2})
+        self.append_ids(3)
+        with open(self.state_file, "ab") as f:
+            f.write(b"12")
+        self.assertEqual(downloader.load_downloaded_photos(self.state_file), {1, 2, 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,8 +2,14 @@ import os
 import sys
 import json
 import random
+import argparse
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import cairo
-from PIL import Image
+import numpy as np
+from PIL import Image, JpegImagePlugin
 from datetime import datetime
 import logging
 
@@ -28,49 +34,104 @@ START_TIME = config.get("START_TIME")  # Expected format "HH:MM:SS"
 DURATION = config.get("DURATION")      # Expected format "HH:MM:SS"
 LOCATIONS = config.get("LOCATIONS")
 
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")  # Images that get stamped
+ROTATE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".tiff")  # Images checked for landscape orientation
+STAMP_FONT_FACE = cairo.ToyFontFace("Noto Sans", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD)
+JPEG_QUALITY = 90  # Quality of stamped JPEG images
+# Replace only 'Jan' and 'Dec' as per requirements
+RUS_MONTHS = {"Jan": "янв", "Dec": "дек"}
+JPEGTRAN = shutil.which("jpegtran")  # Lossless JPEG rotation, used when installed
+RNG = np.random.default_rng()
+
 if not folder_path or not START_TIME or not DURATION or not LOCATIONS:
     logger.error("Missing one or more required configuration parameters.")
     sys.exit(1)
 
 
-def is_leaf_directory(path):
+def remove_stamped_photos(root):
     """
-    Check if the given directory is a leaf directory (contains no subdirectories).
+    Remove previously stamped photos from the given folder.
+    Returns the number of removed files.
     """
-    for _, dirs, _ in os.walk(path):
-        return len(dirs) == 0
+    with os.scandir(root) as entries:
+        stamped = [e.path for e in entries if e.is_file() and "_stamped" in e.name.lower()]
+    removed = 0
+    for file_path in stamped:
+        try:
+            os.remove(file_path)
+            removed += 1
+            logger.debug("Removed stamped file: %s", file_path)
+        except Exception as e:
+            logger.error("Error removing file %s: %s", file_path, e)
+    return removed
+
+
+def rotate_jpeg_lossless(file_path):
+    """
+    Rotate a JPEG clockwise by 90 degrees with jpegtran, without re-encoding it.
+    Only the ICC profile is copied: EXIF is dropped, so no stale Orientation tag rotates it again.
+    Returns False if jpegtran is not available or cannot rotate the file losslessly.
+    """
+    if JPEGTRAN is None:
+        return False
+    tmp_path = file_path + ".tmp"
+    result = subprocess.run(
+        [JPEGTRAN, "-rotate", "90", "-perfect", "-copy", "icc", "-outfile", tmp_path, file_path],
+        capture_output=True
+    )
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, file_path)
     return True
 
 
-def remove_stamped_photos(root):
+def rotate_photo(file_path):
     """
-    Remove previously stamped photos from the given folder.
+    Rotate a single image by -90 degrees if it is landscape (width > height).
+    Returns True if the image was rotated. Only the header is read to check the orientation; JPEGs are rotated losslessly when possible.
     """
-    for file in os.listdir(root):
-        if "_stamped" in file.lower():
-            file_path = os.path.join(root, file)
-            try:
-                os.remove(file_path)
-                logger.info("Removed stamped file: %s", file_path)
-            except Exception as e:
-                logger.error("Error removing file %s: %s", file_path, e)
+    try:
+        with Image.open(file_path) as img:
+            width, height = img.size
+            is_jpeg = img.format == "JPEG"
+        if width <= height:
+            return False
+        if not (is_jpeg and rotate_jpeg_lossless(file_path)):
+            with Image.open(file_path) as img:
+                img.load()
+                # An exact quarter turn is a transpose, no resampling needed
+                rotated_img = img.transpose(Image.Transpose.ROTATE_270)
+                if is_jpeg:
+                    # Re-encode with the original quantization tables and EXIF; the pixels are
+                    # already upright, so the Orientation tag must not make viewers rotate them again
+                    exif = img.getexif()
+                    exif[0x0112] = 1
+                    rotated_img.save(file_path, "JPEG", qtables=img.quantization,
+                                     subsampling=JpegImagePlugin.get_sampling(img),
+                                     exif=exif)
+                else:
+                    rotated_img.save(file_path)
+        logger.debug("Rotated image: %s", file_path)
+        return True
+    except Exception as e:
+        logger.error("Error processing file %s: %s", file_path, e)
+        return False
 
 
 def rotate_landscape_photos(root):
     """
     Rotate landscape images (width > height) by -90 degrees.
+    Folders are already processed one per core, so the images of one folder are rotated serially.
+    Returns the number of rotated images.
     """
-    for file in os.listdir(root):
-        file_path = os.path.join(root, file)
-        if file.lower().endswith((".png", ".jpg", ".jpeg", ".bmp", ".tiff")):
-            try:
-                with Image.open(file_path) as img:
-                    if img.width > img.height:
-                        rotated_img = img.rotate(-90, expand=True)
-                        rotated_img.save(file_path)
-                        logger.info("Rotated image: %s", file_path)
-            except Exception as e:
-                logger.error("Error processing file %s: %s", file_path, e)
+    with os.scandir(root) as entries:
+        images = [
+            e.path for e in entries
+            if e.is_file() and e.name.lower().endswith(ROTATE_EXTS)
+        ]
+    return sum(rotate_photo(image) for image in images)
 
 
 def time_to_seconds(time_str):
@@ -85,38 +146,60 @@ start_seconds = time_to_seconds(START_TIME)
 duration_seconds = time_to_seconds(DURATION)
 
 
-def generate_random_time():
+def generate_random_times(count):
     """
-    Generate a random time (in seconds) within the specified duration.
+    Generate an array of random times (in seconds) within the specified duration,
+    one for each image of a folder.
     """
-    offset = random.randint(0, duration_seconds)
-    return start_seconds + offset
+    return start_seconds + RNG.integers(0, duration_seconds, size=count, endpoint=True)
 
 
 def format_date(date_obj):
     """
     Format the date as 'DD Mon. YYYY г.' with selected month names in Russian.
     """
-    # Replace only 'Jan' and 'Dec' as per requirements
-    months = {"Jan": "янв", "Dec": "дек"}
     formatted_date = date_obj.strftime("%d %b. %Y г.")
-    for eng, rus in months.items():
+    for eng, rus in RUS_MONTHS.items():
         formatted_date = formatted_date.replace(eng, rus)
     return formatted_date
 
 
-def process_image(image_path, date_obj):
+@lru_cache(maxsize=32)
+def get_scaled_font(font_size):
+    """
+    Return the stamp font scaled to the given size.
+    Images of the same height share a font size, so the scaled font is cached.
+    """
+    font_matrix = cairo.Matrix()
+    font_matrix.scale(font_size, font_size)
+    return cairo.ScaledFont(STAMP_FONT_FACE, font_matrix, cairo.Matrix(), cairo.FontOptions())
+
+
+@lru_cache(maxsize=256)
+def get_text_size(line, font_size):
+    """
+    Return the (width, height) of a text line in the stamp font.
+    Location lines repeat across images, so their measurements are cached.
+    """
+    extents = get_scaled_font(font_size).text_extents(line)
+    return extents.width, extents.height
+
+
+def process_image(image_path, date_obj, random_time):
     """
-    Stamp the image with date/time and location text, and save with a '_stamped' suffix.
+    Stamp the image with date/time (random_time, in seconds) and location text,
+    and save with a '_stamped' suffix.
     """
-    random_time = generate_random_time()
     location = random.choice(LOCATIONS)
 
     try:
         with Image.open(image_path) as img:
-            # Resize image (maintain aspect ratio, maximum size 2000x2000)
+            # Resize image (maintain aspect ratio, maximum size 2000x2000);
+            # thumbnail() already lets libjpeg decode large JPEGs at a reduced scale
             img.thumbnail((2000, 2000))
             width, height = img.width, img.height
+            # Only opaque JPEG sources are stamped as JPEG; anything else keeps its alpha as PNG
+            as_jpeg = img.format == "JPEG" and "A" not in img.getbands()
 
             base_name, ext = os.path.splitext(image_path)
             output_image_path = f"{base_name}_stamped{ext}"
@@ -126,22 +209,15 @@ def process_image(image_path, date_obj):
             padding_y = height * 0.004
             font_size = int(height * 0.031)
 
-            # Create a cairo surface to stamp text on the image
-            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+            # Wrap the pixels in a cairo surface directly: cairo's ARGB32 is premultiplied,
+            # native-endian (B, G, R, A bytes on little-endian), which is Pillow's "BGRa" raw mode
+            stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_ARGB32, width)
+            pixels = bytearray(img.convert("RGBA").tobytes("raw", "BGRa", stride))
+            surface = cairo.ImageSurface.create_for_data(pixels, cairo.FORMAT_ARGB32, width, height, stride)
             context = cairo.Context(surface)
 
-            # Save the current PIL image temporarily as PNG for cairo processing
-            temp_png = output_image_path  # Using the same path for temporary PNG
-            img.save(temp_png, format="PNG")
-
-            # Load the saved PNG image into a cairo surface
-            input_surface = cairo.ImageSurface.create_from_png(temp_png)
-            context.set_source_surface(input_surface, 0, 0)
-            context.paint()
-
             # Set font properties for stamping text
-            context.select_font_face("Noto Sans", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD)
-            context.set_font_size(font_size)
+            context.set_scaled_font(get_scaled_font(font_size))
             context.set_source_rgb(1, 1, 1)  # White text
 
             # Format time string
@@ -156,59 +232,101 @@ def process_image(image_path, date_obj):
             # Draw each line aligned to bottom-right
             text_y = padding_y + font_size
             for line in lines:
-                text_extents = context.text_extents(line)
-                text_x = width - text_extents.width - padding_x
+                text_width, text_height = get_text_size(line, font_size)
+                text_x = width - text_width - padding_x
                 context.move_to(text_x, text_y)
                 context.show_text(line)
-                text_y += text_extents.height + font_size * 0.28
-
-            # Write final stamped image to file
-            surface.write_to_png(output_image_path)
-            logger.info("Saved stamped image: %s", output_image_path)
+                text_y += text_height + font_size * 0.28
+
+            # Write final stamped image to file, keeping JPEG sources as JPEG
+            if as_jpeg:
+                surface.flush()
+                stamped = Image.frombuffer("RGBA", (width, height), surface.get_data(), "raw", "BGRa", stride, 1)
+                stamped.convert("RGB").save(output_image_path, "JPEG", quality=JPEG_QUALITY)
+            else:
+                surface.write_to_png(output_image_path)
+            logger.debug("Saved stamped image: %s", output_image_path)
     except Exception as e:
         logger.error("Error processing image %s: %s", image_path, e)
 
 
-def main():
+def process_folder(leaf_dir):
+    """
+    Stamp the image with the longest filename in a leaf folder named 'DD.MM.YYYY...'.
+    Previously stamped photos are removed and landscape photos are rotated first.
+    """
+    folder_name = os.path.basename(leaf_dir)
+    try:
+        # Expect folder name to start with date in format 'DD.MM.YYYY'
+        date_str = folder_name[:10]
+        date_obj = datetime.strptime(date_str, "%d.%m.%Y")
+    except ValueError:
+        logger.warning("Folder '%s' does not contain a valid date. Skipping.", folder_name)
+        return
+
+    removed = remove_stamped_photos(leaf_dir)
+    rotated = rotate_landscape_photos(leaf_dir)
+
+    # Choose the not yet stamped image with the longest filename in one pass
+    longest_name_image, longest_len = None, -1
+    with os.scandir(leaf_dir) as entries:
+        for entry in entries:
+            name_lower = entry.name.lower()
+            if (name_lower.endswith(IMAGE_EXTS) and "_stamped" not in name_lower
+                    and len(entry.name) > longest_len):
+                longest_name_image, longest_len = entry.name, len(entry.name)
+    if longest_name_image is None:
+        logger.info("No suitable images found in folder: %s", leaf_dir)
+        return
+
+    image_path = os.path.join(leaf_dir, longest_name_image)
+    times = generate_random_times(1)
+    process_image(image_path, date_obj, int(times[0]))
+    logger.info("Folder %s: removed %d stamped, rotated %d, stamped '%s'.",
+                leaf_dir, removed, rotated, longest_name_image)
+
+
+def set_log_level(level):
+    """
+    Set the root logger level.
+    """
+    logging.getLogger().setLevel(level)
+
+
+def init_worker(level):
+    """
+    Set the log level of a worker process and give it its own random state,
+    so forked workers do not draw the same times.
+    """
+    global RNG
+    set_log_level(level)
+    RNG = np.random.default_rng()
+
+
+def main(verbose=False):
     """
     Main function to process images in leaf directories.
+    Folders are independent, so they are processed in parallel worker processes;
+    workers read the configuration on import, so only folder paths are sent to them.
+    With verbose=True, every removed, rotated and stamped file is logged as well.
     """
+    log_level = logging.DEBUG if verbose else logging.INFO
+    set_log_level(log_level)
+
     # Get leaf directories (directories without subdirectories)
-    leaf_folders = [root for root, dirs, _ in os.walk(folder_path) if is_leaf_directory(root)]
+    leaf_folders = [root for root, dirs, _ in os.walk(folder_path) if not dirs]
     if not leaf_folders:
         logger.error("No leaf directories found.")
         sys.exit(1)
 
-    for leaf_dir in leaf_folders:
-        folder_name = os.path.basename(leaf_dir)
-        try:
-            # Expect folder name to start with date in format 'DD.MM.YYYY'
-            date_str = folder_name[:10]
-            date_obj = datetime.strptime(date_str, "%d.%m.%Y")
-        except ValueError:
-            logger.warning("Folder '%s' does not contain a valid date. Skipping.", folder_name)
-            continue
-
-        remove_stamped_photos(leaf_dir)
-        rotate_landscape_photos(leaf_dir)
-
-        # Filter image files that are not already stamped
-        images = [
-            f for f in os.listdir(leaf_dir)
-            if f.lower().endswith((".jpg", ".jpeg", ".png"))
-            and "_stamped" not in f.lower()
-        ]
-        if not images:
-            logger.info("No suitable images found in folder: %s", leaf_dir)
-            continue
-
-        # Choose the image with the longest filename
-        longest_name_image = max(images, key=len)
-        image_path = os.path.join(leaf_dir, longest_name_image)
-        process_image(image_path, date_obj)
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=init_worker,
+                             initargs=(log_level,)) as executor:
+        list(executor.map(process_folder, leaf_folders))
 
     logger.info("Processing completed.")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Stamp photos with date, time and location.")
+    parser.add_argument("--verbose", action="store_true", help="Log every processed file")
+    main(parser.parse_args().verbose)
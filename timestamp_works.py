@@ -1,12 +1,20 @@
 import os
 import json
-import random
+import math
 import logging
 import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from datetime import datetime, timedelta
 
 import cairo
-from PIL import Image, ImageChops
+import numpy as np
+from PIL import Image, JpegImagePlugin
+
+try:
+    from numba import njit, prange
+except ImportError:  # Fall back to the NumPy reduction if numba is not installed
+    njit = None
 
 # Configure logging
 logging.basicConfig(
@@ -30,40 +38,91 @@ DURATION_BEFORE_WORKS = config["DURATION_BEFORE_WORKS"]
 DURATION = config["DURATION"]
 LOCATIONS = config["LOCATIONS"]
 
+# Images are compared at this size; the difference only proportions time intervals
+DIFF_THUMBNAIL_SIZE = (256, 256)
+JPEG_QUALITY = 90  # Quality of stamped JPEG images
+RNG = np.random.default_rng()  # Timestamps and locations are drawn in the main process only
+
+# Characters of the filename prefix used to group photos, and the folder date 'DD.MM.YYYY'
+PREFIX_CHARS = frozenset("0123456789_")
+DATE_RE = re.compile(r"\d{2}\.\d{2}\.\d{4}")
 
-def remove_stamped_images(folder_path: str) -> None:
+# Russian month abbreviations, indexed by month number - 1
+RUS_MONTHS = ("янв", "фев", "мар", "апр", "мая", "июн", "июл", "авг", "сен", "окт", "ноя", "дек")
+
+
+def remove_stamped_images(folder: str, files: list) -> list:
     """
-    Recursively remove images with '_stamped' in their filename.
+    Remove images with '_stamped' in their filename from a folder.
+    Returns the names of the remaining files.
     """
-    for root, _, files in os.walk(folder_path):
-        for file in files:
-            if "_stamped" in file.lower():
-                file_path = os.path.join(root, file)
-                try:
-                    os.remove(file_path)
-                    logging.info("Removed stamped image: %s", file_path)
-                except Exception as e:
-                    logging.error("Error removing file %s: %s", file_path, e)
+    remaining = []
+    for file in files:
+        # Stamped names are written in lower case, so check that before lowering
+        if "_stamped" in file or "_stamped" in file.lower():
+            file_path = os.path.join(folder, file)
+            try:
+                os.remove(file_path)
+                logging.info("Removed stamped image: %s", file_path)
+            except Exception as e:
+                logging.error("Error removing file %s: %s", file_path, e)
+        else:
+            remaining.append(file)
+    return remaining
 
 
-def rotate_landscape_photos(folder_path: str) -> None:
+def rotate_photo(file_path: str) -> None:
     """
-    Rotate landscape images (in directories without subdirectories) if width > height.
+    Rotate a single image by -90 degrees if it is landscape (width > height).
+    Opening an image only parses its header, so portrait images are never decoded;
+    pixels are loaded only for images that are actually rotated.
     """
-    for root, _, files in os.walk(folder_path):
-        # Check if folder is a leaf (has no subdirectories)
-        if not [d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d))]:
-            for file in files:
-                if file.lower().endswith((".png", ".jpg", ".jpeg", ".bmp", ".tiff")):
-                    file_path = os.path.join(root, file)
-                    try:
-                        with Image.open(file_path) as img:
-                            if img.width > img.height:
-                                rotated_img = img.rotate(-90, expand=True)
-                                rotated_img.save(file_path)
-                                logging.info("Rotated image: %s", file_path)
-                    except Exception as e:
-                        logging.error("Error processing file %s: %s", file_path, e)
+    try:
+        with Image.open(file_path) as img:
+            width, height = img.size
+            if width <= height:
+                return
+            img.load()
+            # An exact quarter turn is a transpose, no resampling needed
+            rotated_img = img.transpose(Image.Transpose.ROTATE_270)
+            if img.format == "JPEG":
+                # Re-encode with the original quantization tables and EXIF; the pixels are
+                # already upright, so the Orientation tag must not make viewers rotate them again
+                exif = img.getexif()
+                exif[0x0112] = 1
+                rotated_img.save(file_path, "JPEG", qtables=img.quantization,
+                                 subsampling=JpegImagePlugin.get_sampling(img),
+                                 exif=exif)
+            else:
+                rotated_img.save(file_path)
+        logging.info("Rotated image: %s", file_path)
+    except Exception as e:
+        logging.error("Error processing file %s: %s", file_path, e)
+
+
+def rotate_landscape_photos(folder: str, files: list) -> None:
+    """
+    Rotate landscape images of a folder if width > height.
+    """
+    for file in files:
+        if file.lower().endswith((".png", ".jpg", ".jpeg", ".bmp", ".tiff")):
+            rotate_photo(os.path.join(folder, file))
+
+
+def scan_folders(folder_path: str) -> dict:
+    """
+    Walk the photo tree once: remove already stamped photos from every folder and
+    rotate landscape photos in folders without subfolders.
+    Returns {folder: (subfolder names, remaining file names)} for every folder walked.
+    """
+    folders = {}
+    for root, dirs, files in os.walk(folder_path):
+        files = remove_stamped_images(root, files)
+        # os.walk already lists the subdirectories, so a leaf is a folder without any
+        if not dirs:
+            rotate_landscape_photos(root, files)
+        folders[root] = (list(dirs), files)
+    return folders
 
 
 def time_to_seconds(time_str: str) -> int:
@@ -74,21 +133,89 @@ def time_to_seconds(time_str: str) -> int:
     return h * 3600 + m * 60 + s
 
 
-def calculate_visual_difference(img1_path: str, img2_path: str) -> float:
+# Configured times do not change during a run, so parse them once
+START_SECONDS = time_to_seconds(START_TIME)
+BEFORE_WORKS_SECONDS = time_to_seconds(DURATION_BEFORE_WORKS)
+DURATION_SECONDS = time_to_seconds(DURATION)
+
+
+if njit is not None:
+    @njit(parallel=True, nogil=True, cache=True)
+    def sum_abs_differences(stack):
+        """
+        Sum of absolute differences between consecutive images of an (N, H, W, 3) uint8 stack.
+        """
+        n, h, w, c = stack.shape
+        out = np.zeros(n - 1, dtype=np.int64)
+        for i in prange(n - 1):
+            total = 0
+            for y in range(h):
+                for x in range(w):
+                    for k in range(c):
+                        total += abs(np.int64(stack[i + 1, y, x, k]) - np.int64(stack[i, y, x, k]))
+            out[i] = total
+        return out
+else:
+    def sum_abs_differences(stack):
+        """
+        Sum of absolute differences between consecutive images of an (N, H, W, 3) uint8 stack.
+        """
+        return np.abs(np.diff(stack.astype(np.int16), axis=0)).sum(axis=(1, 2, 3), dtype=np.int64)
+
+
+@lru_cache(maxsize=256)
+def load_thumbnail(image_path: str, mtime: float):
     """
-    Calculate the normalized visual difference between two images.
+    Load an image as a DIFF_THUMBNAIL_SIZE RGB uint8 array for visual comparison.
+    Cached by path and modification time; returns None if the image cannot be read.
     """
     try:
-        with Image.open(img1_path) as img1, Image.open(img2_path) as img2:
-            img1 = img1.convert("RGB")
-            img2 = img2.convert("RGB")
-            diff = ImageChops.difference(img1, img2)
-            diff_sum = sum(sum(pixel) for pixel in diff.getdata())
-            max_diff = img1.width * img1.height * 255 * 3
-            return diff_sum / max_diff
+        with Image.open(image_path) as img:
+            # Let libjpeg decode JPEGs at a reduced scale first
+            img.draft("RGB", DIFF_THUMBNAIL_SIZE)
+            thumb = img.convert("RGB").resize(DIFF_THUMBNAIL_SIZE, Image.Resampling.BILINEAR)
+            return np.asarray(thumb, dtype=np.uint8)
     except Exception as e:
-        logging.error("Error comparing images %s and %s: %s", img1_path, img2_path, e)
-        return 0.0
+        logging.error("Error loading image %s: %s", image_path, e)
+        return None
+
+
+def adjacent_differences(image_files: list) -> list:
+    """
+    Return the normalized visual differences between each pair of neighbouring images.
+    Every image is decoded once and all differences are reduced in a single pass;
+    pairs with an unreadable image get a difference of 0.
+    """
+    if len(image_files) < 2:
+        return []
+    thumbs = []
+    for path in image_files:
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = 0.0
+        thumbs.append(load_thumbnail(path, mtime))
+
+    valid = np.array([thumb is not None for thumb in thumbs])
+    blank = np.zeros(DIFF_THUMBNAIL_SIZE[::-1] + (3,), dtype=np.uint8)
+    stack = np.stack([thumb if thumb is not None else blank for thumb in thumbs])
+    diffs = sum_abs_differences(stack) / float(blank.size * 255)
+    diffs[~(valid[1:] & valid[:-1])] = 0.0
+    return diffs.tolist()
+
+
+def random_offsets(count: int) -> list:
+    """
+    Draw random time shifts of up to ±30 minutes (in seconds) in one batch.
+    """
+    return RNG.integers(-1800, 1801, size=count).tolist()
+
+
+def random_locations(count: int) -> list:
+    """
+    Pick a random location for each of count images in one batch.
+    """
+    return [LOCATIONS[i] for i in RNG.integers(0, len(LOCATIONS), size=count).tolist()]
 
 
 def generate_duration_timestamps(num_duration: int, t_before: int, duration: int, duration_images: list) -> list:
@@ -100,14 +227,15 @@ def generate_duration_timestamps(num_duration: int, t_before: int, duration: int
     duration_images.sort(key=lambda x: os.path.basename(x).lower())
 
     # Определение начала и конца интервала с разбросом ±30 минут
-    t_start = t_before + random.randint(-1800, 1800)
-    t_end = t_before + duration + random.randint(-1800, 1800)
+    start_jitter, end_jitter = random_offsets(2)
+    t_start = t_before + start_jitter
+    t_end = t_before + duration + end_jitter
 
     # Проверка, чтобы t_start был меньше t_end
     t_start, t_end = min(t_start, t_end), max(t_start, t_end)
 
     # Расчёт визуальных различий
-    diffs = [calculate_visual_difference(duration_images[i], duration_images[i + 1]) for i in range(num_duration - 1)]
+    diffs = adjacent_differences(duration_images[:num_duration])
     total_diff = sum(diffs) or 1  # Предотвращение деления на ноль
 
     # Интервалы времени
@@ -132,23 +260,21 @@ def generate_timestamps(num_images: int, start_time: int, duration_before: int,
     Чем больше разница между фото, тем больше интервал времени между ними.
     """
     timestamps = []
+    first_jitter, second_jitter = random_offsets(2)
 
     # Время для первого изображения (с небольшим рандомным сдвигом)
-    t1 = start_time + random.randint(-1800, 1800)
+    t1 = start_time + first_jitter
     timestamps.append(t1)
 
     # Время для второго изображения
-    t2 = t1 + duration_before + random.randint(-1800, 1800)
+    t2 = t1 + duration_before + second_jitter
     timestamps.append(t2)
 
     if num_images == 2:
         return sorted(timestamps)
 
     # Вычисляем визуальную разницу между соседними изображениями
-    diffs = []
-    for i in range(1, num_images - 1):
-        diff = calculate_visual_difference(image_files[i], image_files[i + 1])
-        diffs.append(diff)
+    diffs = adjacent_differences(image_files[1:num_images])
 
     # Сумма всех различий
     total_diff = sum(diffs) or 1  # Предотвращение деления на ноль
@@ -170,65 +296,115 @@ def generate_timestamps(num_images: int, start_time: int, duration_before: int,
     return sorted(timestamps)
 
 
+def set_stamp_font(context: cairo.Context, font_size: int) -> None:
+    """
+    Select the white bold stamp font on a cairo context.
+    """
+    context.select_font_face("Noto Sans", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD)
+    context.set_font_size(font_size)
+    context.set_source_rgb(1, 1, 1)
+
+
+@lru_cache(maxsize=256)
+def render_text_surface(lines: tuple, font_size: int) -> tuple:
+    """
+    Render right-aligned stamp text lines once onto a small transparent surface.
+    Locations repeat across photos, so their text is rasterized once per worker process
+    and painted onto each photo. Returns (surface, right, baseline): the point of the
+    surface that the right edge and baseline of the first line are aligned to.
+    """
+    measure = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
+    set_stamp_font(measure, font_size)
+    extents = [measure.text_extents(line) for line in lines]
+    ascent, descent = measure.font_extents()[:2]
+
+    # Leave room for glyphs that extend past their logical extents
+    margin = math.ceil(font_size * 0.25)
+    right = math.ceil(max(e.width for e in extents)) + margin
+    baseline = math.ceil(ascent) + margin
+    last_baseline = baseline + sum(e.height + font_size * 0.28 for e in extents[:-1])
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, right + margin,
+                                 math.ceil(last_baseline + descent) + margin)
+
+    context = cairo.Context(surface)
+    set_stamp_font(context, font_size)
+    text_y = baseline
+    for line, line_extents in zip(lines, extents):
+        context.move_to(right - line_extents.width, text_y)
+        context.show_text(line)
+        text_y += line_extents.height + font_size * 0.28
+    surface.flush()
+    return surface, right, baseline
+
+
 def process_image(image_path: str, timestamp: int, date_obj: datetime, location: str) -> None:
     """
     Stamp an image with the date, time, and location information using cairo.
+    The result is saved as a '_stamped' JPEG next to the source image; transparent areas
+    of PNG sources are flattened onto white, since JPEG has no alpha channel.
     """
     try:
         with Image.open(image_path) as img:
+            # thumbnail() already lets libjpeg decode large JPEGs at a reduced scale
             img.thumbnail((2000, 2000))
             width, height = img.width, img.height
-            output_image_path = f"{os.path.splitext(image_path)[0]}_stamped.png"
-
-            # Create a cairo surface and context
-            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+            output_image_path = f"{os.path.splitext(image_path)[0]}_stamped.jpg"
+
+            # Wrap the pixels in a cairo surface directly: cairo's ARGB32 is premultiplied,
+            # native-endian (B, G, R, A bytes on little-endian), which is Pillow's "BGRa" raw mode
+            stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_ARGB32, width)
+            rgba = img.convert("RGBA")
+            if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+                rgba = Image.alpha_composite(Image.new("RGBA", rgba.size, "white"), rgba)
+            pixels = bytearray(rgba.tobytes("raw", "BGRa", stride))
+            surface = cairo.ImageSurface.create_for_data(pixels, cairo.FORMAT_ARGB32, width, height, stride)
             context = cairo.Context(surface)
 
-            # Save the PIL image temporarily as PNG and load into cairo
-            temp_path = output_image_path
-            img.save(temp_path, format="PNG")
-            input_surface = cairo.ImageSurface.create_from_png(temp_path)
-            context.set_source_surface(input_surface, 0, 0)
-            context.paint()
-
             # Set font and calculate positions
             font_size = int(height * 0.031)
             padding_x = width * 0.004
             padding_y = height * 0.004
-            context.select_font_face("Noto Sans", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD)
-            context.set_font_size(font_size)
-            context.set_source_rgb(1, 1, 1)
+            set_stamp_font(context, font_size)
 
             # Format date and time
-            months = {
-                "Jan": "янв", "Feb": "фев", "Mar": "мар", "Apr": "апр",
-                "May": "мая", "Jun": "июн", "Jul": "июл", "Aug": "авг",
-                "Sep": "сен", "Oct": "окт", "Nov": "ноя", "Dec": "дек"
-            }
-            formatted_date = date_obj.strftime("%d %b. %Y")
-            for eng, rus in months.items():
-                formatted_date = formatted_date.replace(eng, rus)
-            formatted_date += " г."
+            formatted_date = f"{date_obj.day:02d} {RUS_MONTHS[date_obj.month - 1]}. {date_obj.year} г."
             time_str = f"{formatted_date} {timestamp // 3600:02}:{(timestamp % 3600) // 60:02}:{timestamp % 60:02}"
 
-            # Split location info into lines if needed
-            lines = [time_str] + location.split("\n")
+            # The time differs for every photo, so draw it directly
             text_y = padding_y + font_size
+            extents = context.text_extents(time_str)
+            context.move_to(width - extents.width - padding_x, text_y)
+            context.show_text(time_str)
+            text_y += extents.height + font_size * 0.28
+
+            # Location lines (split if needed) come from the cached text surface;
+            # it is placed on whole pixels so painting it does not resample the glyphs
+            text_surface, right, baseline = render_text_surface(tuple(location.split("\n")), font_size)
+            context.set_source_surface(text_surface, round(width - padding_x - right), round(text_y - baseline))
+            context.paint()
 
-            # Draw each line on the image
-            for line in lines:
-                extents = context.text_extents(line)
-                text_x = width - extents.width - padding_x
-                context.move_to(text_x, text_y)
-                context.show_text(line)
-                text_y += extents.height + font_size * 0.28
-
-            surface.write_to_png(output_image_path)
+            # Encode the stamped pixels as JPEG straight from the cairo surface
+            surface.flush()
+            stamped = Image.frombuffer("RGBA", (width, height), surface.get_data(), "raw", "BGRa", stride, 1)
+            stamped.convert("RGB").save(output_image_path, "JPEG", quality=JPEG_QUALITY)
             logging.info("Saved stamped image: %s", output_image_path)
     except Exception as e:
         logging.error("Error processing image %s: %s", image_path, e)
 
 
+def file_prefix(filename: str) -> str:
+    """
+    Return the group prefix of a filename: its leading digits and underscores without
+    trailing underscores, or the whole filename if it does not start with one.
+    """
+    end = 0
+    while end < len(filename) and filename[end] in PREFIX_CHARS:
+        end += 1
+    if not end:
+        return filename
+    return filename[:end].rstrip('_')
+
+
 def group_by_prefix(candidates: list) -> list:
     """
     Group file paths by prefix.
@@ -238,11 +414,7 @@ def group_by_prefix(candidates: list) -> list:
     groups = {}
     for path in candidates:
         filename = os.path.basename(path)
-        match = re.match(r'^([\d_]+)', filename)
-        if match:
-            prefix = match.group(1).rstrip('_')
-        else:
-            prefix = filename
+        prefix = file_prefix(filename)
         if prefix in groups:
             if len(filename) > len(os.path.basename(groups[prefix])):
                 groups[prefix] = path
@@ -251,134 +423,128 @@ def group_by_prefix(candidates: list) -> list:
     return list(groups.values())
 
 
-def process_incident(incident_folder: str) -> None:
-    subfolders = sorted(  # Сортировка папок по алфавиту
+def adjust_timestamp(t: int, base_date: datetime) -> tuple:
+    """
+    Carry whole days of a timestamp (seconds from midnight of base_date) into the date.
+    Returns the date and the remaining seconds within that day.
+    """
+    days, t = divmod(t, 86400)
+    return base_date + timedelta(days=days), t
+
+
+def get_grouped_images(folder: str, files: list) -> list:
+    """
+    Return the unstamped images among a folder's files, one per filename prefix, sorted by name.
+    """
+    candidates = sorted(  # Сортировка файлов по алфавиту
         [
-            os.path.join(incident_folder, d)
-            for d in os.listdir(incident_folder)
-            if os.path.isdir(os.path.join(incident_folder, d))
+            os.path.join(folder, f)
+            for f in files
+            if f.lower().endswith((".jpg", ".jpeg", ".png")) and "_stamped" not in f.lower()
         ],
-        key=lambda d: os.path.basename(d).lower()
+        key=lambda x: os.path.basename(x).lower()
     )
 
-    all_images = []  # Список для всех изображений в нужном порядке
+    # Группировка файлов по префиксу
+    grouped_files = group_by_prefix(candidates)
 
-    for folder in subfolders:
-        candidates = sorted(  # Сортировка файлов по алфавиту
-            [
-                os.path.join(folder, f)
-                for f in os.listdir(folder)
-                if f.lower().endswith((".jpg", ".jpeg", ".png")) and "_stamped" not in f.lower()
-            ],
-            key=lambda x: os.path.basename(x).lower()
-        )
+    # Сортировка сгруппированных файлов по имени
+    grouped_files.sort(key=lambda x: os.path.basename(x).lower())
+    return grouped_files
 
-        # Группировка файлов по префиксу
-        grouped_files = group_by_prefix(candidates)
 
-        # Сортировка сгруппированных файлов по имени
-        grouped_files.sort(key=lambda x: os.path.basename(x).lower())
+def process_incident(incident_folder: str, executor: ProcessPoolExecutor, folders: dict) -> list:
+    """
+    Stamp the images of an incident folder with subfolders.
+    Folder contents come from the scan_folders listing.
+    The images are submitted to the executor; the returned futures complete when they are stamped.
+    """
+    subfolders = sorted(  # Сортировка папок по алфавиту
+        [os.path.join(incident_folder, d) for d in folders[incident_folder][0]],
+        key=lambda d: os.path.basename(d).lower()
+    )
+
+    all_images = []  # Список для всех изображений в нужном порядке
 
+    for folder in subfolders:
         # Добавляем в общий список
-        all_images.extend(grouped_files)
+        all_images.extend(get_grouped_images(folder, folders.get(folder, ([], []))[1]))
 
     # Проверка даты для первой папки
-    folder_date_match = re.search(r"\d{2}\.\d{2}\.\d{4}", os.path.basename(subfolders[0]))
+    folder_date_match = DATE_RE.search(os.path.basename(subfolders[0]))
     if not folder_date_match:
         logging.error("Incident %s: Could not extract date from folder name", incident_folder)
-        return
+        return []
     incident_date = datetime.strptime(folder_date_match.group(), "%d.%m.%Y")
 
     # Генерация временных меток
-    start_seconds = time_to_seconds(START_TIME)
-    before_seconds = time_to_seconds(DURATION_BEFORE_WORKS)
-    duration_seconds = time_to_seconds(DURATION)
-
-    timestamps = generate_timestamps(len(all_images), start_seconds, before_seconds, duration_seconds, all_images)
-
-    def adjust_timestamp(t: int, base_date: datetime) -> (datetime, int):
-        current_date = base_date
-        while t >= 86400:
-            current_date += timedelta(days=1)
-            t -= 86400
-        return current_date, t
+    timestamps = generate_timestamps(len(all_images), START_SECONDS, BEFORE_WORKS_SECONDS, DURATION_SECONDS,
+                                     all_images)
 
     # Штамповка файлов в нужном порядке
-    for img_path, ts in zip(all_images, timestamps):
+    futures = []
+    locations = random_locations(len(all_images))
+    for img_path, ts, location in zip(all_images, timestamps, locations):
         current_date, t = adjust_timestamp(ts, incident_date)
-        process_image(img_path, t, current_date, random.choice(LOCATIONS))
+        futures.append(executor.submit(process_image, img_path, t, current_date, location))
+    return futures
 
 
-def process_folder(folder: str) -> None:
-    candidates = sorted(  # Сортировка файлов по алфавиту
-        [
-            os.path.join(folder, f)
-            for f in os.listdir(folder)
-            if f.lower().endswith((".jpg", ".jpeg", ".png")) and "_stamped" not in f.lower()
-        ],
-        key=lambda x: os.path.basename(x).lower()
-    )
-
-    if not candidates:
+def process_folder(folder: str, executor: ProcessPoolExecutor, files: list) -> list:
+    """
+    Stamp the images of a leaf incident folder, given the names of its files.
+    The images are submitted to the executor; the returned futures complete when they are stamped.
+    """
+    grouped_files = get_grouped_images(folder, files)
+    if not grouped_files:
         logging.info("No candidate images in folder: %s", folder)
-        return
-
-    # Группировка файлов по префиксу
-    grouped_files = group_by_prefix(candidates)
-
-    # Сортировка сгруппированных файлов по имени
-    grouped_files.sort(key=lambda x: os.path.basename(x).lower())
+        return []
 
     folder_name = os.path.basename(folder)
-    date_match = re.search(r"\d{2}\.\d{2}\.\d{4}", folder_name)
+    date_match = DATE_RE.search(folder_name)
     if not date_match:
         logging.error("Could not extract date from folder name: %s", folder_name)
-        return
+        return []
     folder_date = datetime.strptime(date_match.group(), "%d.%m.%Y")
 
-    start_seconds = time_to_seconds(START_TIME)
-    duration_before_seconds = time_to_seconds(DURATION_BEFORE_WORKS)
-    duration_seconds = time_to_seconds(DURATION)
-
-    timestamps = generate_timestamps(len(grouped_files), start_seconds, duration_before_seconds, duration_seconds, grouped_files)
-
-    def adjust_timestamp(t: int, base_date: datetime) -> (datetime, int):
-        current_date = base_date
-        while t >= 86400:
-            current_date += timedelta(days=1)
-            t -= 86400
-        return current_date, t
+    timestamps = generate_timestamps(len(grouped_files), START_SECONDS, BEFORE_WORKS_SECONDS, DURATION_SECONDS,
+                                     grouped_files)
 
     # Штамповка файлов
-    for img_path, ts in zip(grouped_files, timestamps):
+    futures = []
+    locations = random_locations(len(grouped_files))
+    for img_path, ts, location in zip(grouped_files, timestamps, locations):
         current_date, t = adjust_timestamp(ts, folder_date)
-        process_image(img_path, t, current_date, random.choice(LOCATIONS))
+        futures.append(executor.submit(process_image, img_path, t, current_date, location))
+    return futures
 
 
 def main() -> None:
     """
     Main function:
-      - Removes already stamped photos.
-      - Rotates landscape photos.
+      - Walks the photo tree once, removing already stamped photos and rotating landscape photos.
       - Processes each incident (top-level folders like "1", "2", etc.).
         If the incident has subfolders, process_incident is used;
         if it's a leaf folder, process_folder is used.
+    Timestamps and locations are chosen here; the images are stamped in worker processes.
     """
-    remove_stamped_images(FOLDER_PATH)
-    rotate_landscape_photos(FOLDER_PATH)
-    for incident in os.listdir(FOLDER_PATH):
-        incident_path = os.path.join(FOLDER_PATH, incident)
-        if os.path.isdir(incident_path):
-            subfolders = [
-                d for d in os.listdir(incident_path)
-                if os.path.isdir(os.path.join(incident_path, d))
-            ]
+    folders = scan_folders(FOLDER_PATH)
+    futures = []
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for incident in folders.get(FOLDER_PATH, ([], []))[0]:
+            incident_path = os.path.join(FOLDER_PATH, incident)
+            # Folders that could not be listed are missing from the scan
+            if incident_path not in folders:
+                continue
+            subfolders, files = folders[incident_path]
             if subfolders:
                 logging.info("Processing incident: %s", incident_path)
-                process_incident(incident_path)
+                futures.extend(process_incident(incident_path, executor, folders))
             else:
                 logging.info("Processing leaf folder: %s", incident_path)
-                process_folder(incident_path)
+                futures.extend(process_folder(incident_path, executor, files))
+        for future in futures:
+            future.result()
 
 
 if __name__ == "__main__":